@@ -1,16 +1,61 @@
+import asyncio
 import datetime as dt
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional
 from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security.utils import get_authorization_scheme_param
 import jwt
 from jwt import PyJWTError as JWTError
-from passlib.handlers.bcrypt import bcrypt
+from passlib.context import CryptContext
 from rich.console import Console
 from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, COOKIE_NAME, SERVICE_CONFIG
 from .database import get_db_connection
+from .queries import fetchrow
+from .ratelimit import AttemptLimiter
 
 console = Console()
 
+USER_CACHE_TTL = SERVICE_CONFIG.get("user_cache_ttl", 30)
+USER_CACHE_SIZE = SERVICE_CONFIG.get("user_cache_size", 10000)
+
+# user_id -> (момент устаревания, строка users). Изменения users сбрасывают запись
+# через NOTIFY user_changed (триггер в БД), TTL — страховка на случай потерянного NOTIFY
+_user_cache = OrderedDict()
+
+# bcrypt занимает CPU на 100–300 мс, поэтому хэширование идет в отдельном пуле потоков,
+# а не в цикле событий. При смене bcrypt_rounds хэш пересчитывается при следующем входе
+BCRYPT_ROUNDS = SERVICE_CONFIG.get("bcrypt_rounds", 12)
+PASSWORD_HASH_WORKERS = SERVICE_CONFIG.get("password_hash_workers", 2)
+LOGIN_MAX_FAILURES = SERVICE_CONFIG.get("login_max_failures", 5)
+LOGIN_MAX_FAILURES_PER_IP = SERVICE_CONFIG.get("login_max_failures_per_ip", 20)
+LOGIN_FAILURE_WINDOW = SERVICE_CONFIG.get("login_failure_window", 300)
+
+_pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+# Хэш для проверки несуществующего логина: время ответа не выдает, есть ли такой пользователь
+_dummy_hash = _pwd_context.hash(uuid.uuid4().hex)
+# Неудачные входы считаются по паре (логин, IP): чужие попытки с другого адреса не блокируют
+# владельца логина. Перебор многих логинов с одного адреса ограничивает отдельный счетчик по IP.
+# Счетчики живут в памяти процесса: каждый воркер uvicorn/gunicorn применяет лимиты сам по себе,
+# так что общий лимит на сервис — лимит, умноженный на число воркеров
+_login_failures = AttemptLimiter(LOGIN_MAX_FAILURES, LOGIN_FAILURE_WINDOW)
+_ip_failures = AttemptLimiter(LOGIN_MAX_FAILURES_PER_IP, LOGIN_FAILURE_WINDOW)
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, _pwd_context.hash, password)
+
+async def verify_password(password: str, password_hash: str) -> tuple:
+    # Возвращает (пароль верен, новый хэш или None, если пересчет не нужен)
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, _pwd_context.verify_and_update, password, password_hash
+    )
+
 async def check_user_exists(telegram_id: str, conn=Depends(get_db_connection)) -> bool:
     return await conn.fetchval("SELECT EXISTS(SELECT 1 FROM users WHERE telegram_id = $1)", telegram_id)
 
@@ -23,7 +68,7 @@ async def register_user(telegram_id: str, username: str, password: str, conn=Dep
     if await check_user_exists(telegram_id, conn):
         raise HTTPException(status_code=400, detail="Telegram ID already registered")
     
-    hashed_password = bcrypt.hash(password)
+    hashed_password = await hash_password(password)
     trial_end = dt.datetime.utcnow() + dt.timedelta(days=SERVICE_CONFIG["free_period_days"])
     await conn.execute(
         """
@@ -37,10 +82,43 @@ async def get_user(username: str, conn=Depends(get_db_connection)) -> Optional[d
     row = await conn.fetchrow("SELECT * FROM users WHERE username = $1", username)
     return dict(row) if row else None
 
+async def get_user_by_id(user_id: int, conn) -> Optional[dict]:
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        _user_cache.move_to_end(user_id)
+        return dict(cached[1])
+
+    row = await fetchrow(conn, "user_by_id", user_id)
+    if not row:
+        _user_cache.pop(user_id, None)
+        return None
+    user = dict(row)
+    _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL, user)
+    _user_cache.move_to_end(user_id)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+    return dict(user)
+
+def invalidate_user(user_id: int = None):
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(user_id, None)
+
+def on_user_changed_notify(payload: str):
+    invalidate_user(int(payload) if payload else None)
+
 async def authenticate_user(username: str, plain_password: str, conn=Depends(get_db_connection)) -> Optional[dict]:
     user = await get_user(username, conn)
-    if not user or not bcrypt.verify(plain_password, user["password_hash"]):
+    if not user:
+        await verify_password(plain_password, _dummy_hash)
+        return False
+    valid, new_hash = await verify_password(plain_password, user["password_hash"])
+    if not valid:
         return False
+    if new_hash:
+        await conn.execute("UPDATE users SET password_hash = $1 WHERE id = $2", new_hash, user["id"])
+        console.log(f"[green]Password hash of user #{user['id']} upgraded to {BCRYPT_ROUNDS} rounds")
     return user
 
 async def oauth2_scheme(request: Request) -> Optional[str]:
@@ -57,7 +135,7 @@ async def oauth2_scheme(request: Request) -> Optional[str]:
 def create_access_token(data: Dict) -> str:
     to_encode = data.copy()
     expire = dt.datetime.utcnow() + dt.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -75,11 +153,32 @@ def decode_token(token: str) -> dict:
     except JWTError as e:
         console.log(f"[red]JWT Error: {e}")
         raise credentials_exception
-    return {"username": username}
+    # Токены, выданные до появления id в claims, содержат только username
+    return {
+        "username": username,
+        "id": payload.get("user_id"),
+        "telegram_id": payload.get("telegram_id"),
+        "jti": payload.get("jti"),
+    }
+
+async def _load_user(user_data: dict, conn) -> Optional[dict]:
+    if user_data["id"] is None:
+        return await get_user(user_data["username"], conn)
+    return await get_user_by_id(user_data["id"], conn)
 
 async def get_current_user_from_token(token: str = Depends(oauth2_scheme), conn=Depends(get_db_connection)) -> dict:
     user_data = decode_token(token)
-    db_user = await get_user(user_data["username"], conn)
+    db_user = await _load_user(user_data, conn)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return db_user
+
+async def get_current_user_claims(token: str = Depends(oauth2_scheme), conn=Depends(get_db_connection)) -> dict:
+    # Для страниц, которым нужны только id и telegram_id: берем их из JWT без запроса к БД
+    user_data = decode_token(token)
+    if user_data["id"] is not None and user_data["telegram_id"] is not None:
+        return user_data
+    db_user = await _load_user(user_data, conn)
     if not db_user:
         raise HTTPException(status_code=401, detail="User not found")
     return db_user
@@ -89,13 +188,24 @@ async def get_current_user_from_cookie(request: Request, conn=Depends(get_db_con
     if not token:
         return None
     user_data = decode_token(token)
-    return await get_user(user_data["username"], conn)
+    return await _load_user(user_data, conn)
 
-async def login_for_access_token(response: Response, username: str, password: str, conn=Depends(get_db_connection)) -> Dict[str, str]:
+async def login_for_access_token(
+    response: Response, username: str, password: str, conn=Depends(get_db_connection), client_ip: str = None
+) -> Dict[str, str]:
+    login_key = (username, client_ip)
+    if _login_failures.blocked(login_key) or (client_ip and _ip_failures.blocked(client_ip)):
+        raise HTTPException(status_code=429, detail="Слишком много попыток входа. Попробуйте позже.")
     user = await authenticate_user(username, password, conn)
     if not user:
+        _login_failures.record(login_key)
+        if client_ip:
+            _ip_failures.record(client_ip)
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    access_token = create_access_token(data={"username": user["username"]})
+    _login_failures.reset(login_key)
+    access_token = create_access_token(
+        data={"username": user["username"], "user_id": user["id"], "telegram_id": user["telegram_id"]}
+    )
     response.set_cookie(
         key=COOKIE_NAME,
         value=f"Bearer {access_token}",
@@ -0,0 +1,96 @@
+import datetime as dt
+import time
+from decimal import Decimal
+from rich.console import Console
+from .config import SERVICE_CONFIG
+
+console = Console()
+
+BILLING_CHUNK_SIZE = SERVICE_CONFIG.get("billing_chunk_size", 1000)
+# Ключ pg_try_advisory_lock: списание выполняет только один процесс в кластере
+BILLING_LOCK_KEY = 1003
+
+# Одна пачка пользователей за транзакцию. Строка в billing_ledger появляется только при первом
+# списании за день, поэтому повторный запуск (или второй воркер) ничего не спишет повторно.
+# Пробный период с одним ботом не списывается, при нехватке средств все боты останавливаются.
+BILLING_CHUNK_SQL = """
+WITH active AS (
+    SELECT user_id, COUNT(*) AS bots_count
+    FROM bots
+    WHERE status = 'active' AND user_id > $2
+    GROUP BY user_id
+    ORDER BY user_id
+    LIMIT $3
+),
+candidates AS (
+    SELECT u.id AS user_id, a.bots_count, a.bots_count * $4::numeric AS amount,
+           CASE
+               WHEN u.trial_end_date > NOW() AT TIME ZONE 'UTC' AND a.bots_count = 1 THEN 'trial'
+               WHEN u.balance < a.bots_count * $4::numeric THEN 'insufficient'
+               ELSE 'charged'
+           END AS outcome
+    FROM active a
+    JOIN users u ON u.id = a.user_id
+    FOR UPDATE OF u
+),
+ledger AS (
+    INSERT INTO billing_ledger (user_id, billing_date, bots_count, amount, outcome)
+    SELECT user_id, $1, bots_count, CASE WHEN outcome = 'charged' THEN amount ELSE 0 END, outcome
+    FROM candidates
+    ON CONFLICT (user_id, billing_date) DO NOTHING
+    RETURNING user_id, amount, outcome
+),
+charged AS (
+    UPDATE users u SET balance = u.balance - l.amount
+    FROM ledger l
+    WHERE u.id = l.user_id AND l.outcome = 'charged'
+    RETURNING u.id
+),
+stopped AS (
+    UPDATE bots b SET status = 'stopped'
+    FROM ledger l
+    WHERE b.user_id = l.user_id AND l.outcome = 'insufficient' AND b.status = 'active'
+    RETURNING b.id, b.user_id
+),
+notified AS (
+    INSERT INTO notifications (telegram_id, text, category, status, created_at)
+    SELECT u.telegram_id, 'Баланс недостаточен для бота #' || s.id || '. Пополните баланс.', 'billing', 'pending', NOW()
+    FROM stopped s
+    JOIN users u ON u.id = s.user_id
+    RETURNING 1
+)
+SELECT (SELECT MAX(user_id) FROM active) AS last_user_id,
+       (SELECT COUNT(*) FROM charged) AS charged,
+       (SELECT COUNT(*) FROM stopped) AS stopped
+"""
+
+async def run_billing(pool, billing_date: dt.date = None) -> dict:
+    billing_date = billing_date or dt.datetime.utcnow().date()
+    cost = Decimal(str(SERVICE_CONFIG["bot_daily_cost"]))
+    totals = {"charged": 0, "stopped": 0}
+
+    async with pool.acquire() as lock_conn:
+        if not await lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", BILLING_LOCK_KEY):
+            console.log("[yellow]Billing is already running in another process")
+            return totals
+        try:
+            started = time.perf_counter()
+            last_user_id = 0
+            while True:
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        result = await conn.fetchrow(
+                            BILLING_CHUNK_SQL, billing_date, last_user_id, BILLING_CHUNK_SIZE, cost
+                        )
+                if result["last_user_id"] is None:
+                    break
+                last_user_id = result["last_user_id"]
+                totals["charged"] += result["charged"]
+                totals["stopped"] += result["stopped"]
+            console.log(
+                f"[green]Billing for {billing_date}: charged {totals['charged']} users, "
+                f"stopped {totals['stopped']} bots in {time.perf_counter() - started:.1f}s"
+            )
+        finally:
+            await lock_conn.execute("SELECT pg_advisory_unlock($1)", BILLING_LOCK_KEY)
+    return totals
@@ -2,8 +2,8 @@ import asyncio
 import asyncpg
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
-from config import TELEGRAM_TOKEN, SERVICE_CONFIG, DB_CONFIG, API_BASE_URL
-from auth import register_user
+from .config import TELEGRAM_TOKEN, SERVICE_CONFIG, DB_CONFIG, API_BASE_URL
+from .auth import register_user
 from rich.console import Console
 
 console = Console()
@@ -69,31 +69,10 @@ async def process_input(message: types.Message):
             )
             await bot.send_message(telegram_id, "Регистрация завершена! Войдите на сайте.")
 
-async def process_notifications():
-    pool = dp["db_pool"]
-    while True:
-        async with pool.acquire() as conn:
-            notifications = await conn.fetch("SELECT * FROM notifications WHERE status = 'pending'")
-            for notification in notifications:
-                try:
-                    await bot.send_message(notification["telegram_id"], notification["text"])
-                    await conn.execute(
-                        "UPDATE notifications SET status = 'sent', sent_at = NOW() WHERE id = $1",
-                        notification["id"]
-                    )
-                    console.log(f"[green]Notification sent to {notification['telegram_id']}: {notification['text']}")
-                except Exception as e:
-                    console.log(f"[red]Error sending notification to {notification['telegram_id']}: {e}")
-                    await conn.execute(
-                        "UPDATE notifications SET status = 'failed', sent_at = NOW() WHERE id = $1",
-                        notification["id"]
-                    )
-        await asyncio.sleep(10)  # Проверять каждые 10 секунд
-
 async def main():
     pool = await create_db_pool()
     dp["db_pool"] = pool
-    asyncio.create_task(process_notifications())  # Запускаем задачу обработки уведомлений
+    # Уведомления рассылает планировщик (app/run_scheduler.py)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
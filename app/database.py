@@ -1,13 +1,65 @@
+import asyncio
+import time
 import asyncpg
-from .config import DB_CONFIG
+from .config import DB_CONFIG, SERVICE_CONFIG
+from .metrics import incr, observe
+from .queries import AppConnection, init_connection
+
+DB_POOL_MIN_SIZE = SERVICE_CONFIG.get("db_pool_min_size", 5)
+DB_POOL_MAX_SIZE = SERVICE_CONFIG.get("db_pool_max_size", 20)
+DB_STATEMENT_CACHE_SIZE = SERVICE_CONFIG.get("db_statement_cache_size", 200)
+DB_COMMAND_TIMEOUT = SERVICE_CONFIG.get("db_command_timeout", 30)
+DB_ACQUIRE_TIMEOUT = SERVICE_CONFIG.get("db_acquire_timeout", 10)
+DB_MAX_INACTIVE_LIFETIME = SERVICE_CONFIG.get("db_max_inactive_lifetime", 300)
 
 _pool = None
 
+class _TimedAcquire:
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        try:
+            self._conn = await self._pool.acquire(timeout=self._timeout)
+        except asyncio.TimeoutError:
+            incr("db.acquire_timeouts")
+            raise
+        observe("db.acquire_seconds", time.perf_counter() - started)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        await self._pool.release(self._conn)
+
+# Пул с замером ожидания свободного соединения: рост db.acquire_seconds означает,
+# что пул мал для нагрузки или соединения надолго заняты
+class TimedPool:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def acquire(self, timeout: float = DB_ACQUIRE_TIMEOUT):
+        return _TimedAcquire(self._pool, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
 async def init_pool():
     global _pool
      
     try:
-        _pool = await asyncpg.create_pool(**DB_CONFIG)
+        pool = await asyncpg.create_pool(
+            **DB_CONFIG,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            connection_class=AppConnection,
+            init=init_connection,
+        )
+        _pool = TimedPool(pool)
         print("Database pool initialized successfully")
     except Exception as e:
         print(f"Failed to connect to database: {e}")
@@ -21,4 +73,7 @@ async def close_pool():
 async def get_db_connection():
     global _pool
     async with _pool.acquire() as conn:
-        yield conn
\ No newline at end of file
+        yield conn
+
+def get_pool():
+    return _pool
@@ -0,0 +1,94 @@
+import asyncio
+import asyncpg
+from rich.console import Console
+from .config import DB_CONFIG, SERVICE_CONFIG
+
+console = Console()
+
+# Проверка соединения LISTEN: обрыв сети без закрытия сокета иначе не заметен
+LISTEN_HEALTH_INTERVAL = SERVICE_CONFIG.get("listen_health_interval", 30)
+LISTEN_HEALTH_TIMEOUT = SERVICE_CONFIG.get("listen_health_timeout", 5)
+LISTEN_RECONNECT_MAX_DELAY = SERVICE_CONFIG.get("listen_reconnect_max_delay", 30)
+
+# Отдельное соединение для LISTEN: соединения пула для этого не годятся,
+# подписка живет столько же, сколько процесс. При обрыве соединение пересоздается,
+# а каждый обработчик вызывается с пустым payload («сбросить все»): пока подписки не было,
+# уведомления могли потеряться
+_connection = None
+_handlers = {}
+_tasks = set()
+_stopping = False
+
+def register_handler(channel: str, handler):
+    _handlers[channel] = handler
+
+def _dispatch(connection, pid, channel, payload):
+    try:
+        _handlers[channel](payload)
+    except Exception as e:
+        console.log(f"[red]Ошибка обработки NOTIFY {channel}: {e}")
+
+def _spawn(coro):
+    task = asyncio.ensure_future(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _connect():
+    global _connection
+    connection = await asyncpg.connect(**DB_CONFIG)
+    for channel in _handlers:
+        await connection.add_listener(channel, _dispatch)
+    connection.add_termination_listener(_connection_lost)
+    _connection = connection
+
+def _connection_lost(connection):
+    global _connection
+    if _stopping or connection is not _connection:
+        return
+    console.log("[yellow]LISTEN connection lost, reconnecting")
+    _connection = None
+    _spawn(_reconnect())
+
+async def _reconnect():
+    delay = 1
+    while not _stopping:
+        try:
+            await _connect()
+        except Exception as e:
+            console.log(f"[red]LISTEN reconnect failed: {e}, next attempt in {delay}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTEN_RECONNECT_MAX_DELAY)
+            continue
+        for channel in _handlers:
+            _dispatch(_connection, None, channel, "")
+        console.log(f"[green]Listening on channels again: {', '.join(_handlers)}")
+        return
+
+async def _health_loop():
+    while not _stopping:
+        await asyncio.sleep(LISTEN_HEALTH_INTERVAL)
+        connection = _connection
+        if connection is None:
+            continue
+        try:
+            await asyncio.wait_for(connection.fetchval("SELECT 1"), LISTEN_HEALTH_TIMEOUT)
+        except Exception as e:
+            console.log(f"[yellow]LISTEN connection check failed: {e}")
+            connection.terminate()
+            _connection_lost(connection)
+
+async def start_listener():
+    global _stopping
+    _stopping = False
+    await _connect()
+    _spawn(_health_loop())
+    console.log(f"[green]Listening on channels: {', '.join(_handlers)}")
+
+async def stop_listener():
+    global _connection, _stopping
+    _stopping = True
+    for task in list(_tasks):
+        task.cancel()
+    if _connection:
+        await _connection.close()
+        _connection = None
@@ -0,0 +1,190 @@
+import asyncio
+import time
+import uuid
+from rich.console import Console
+from .config import SERVICE_CONFIG
+from .database import get_pool
+from .lease_queue import LeaseQueue
+from .metrics import incr, observe
+from .queries import executemany, fetch
+from .models.avito import process_avito_message
+
+console = Console()
+
+INBOX_CONCURRENCY = SERVICE_CONFIG.get("inbox_concurrency", 8)
+INBOX_BATCH_SIZE = SERVICE_CONFIG.get("inbox_batch_size", 16)
+INBOX_POLL_INTERVAL = SERVICE_CONFIG.get("inbox_poll_interval", 1.0)
+INBOX_LEASE_SECONDS = SERVICE_CONFIG.get("inbox_lease_seconds", 300)
+# Пока сообщение обрабатывается (очередь LLM, потоковый ответ, краткое содержание), аренда продлевается
+INBOX_LEASE_RENEW_INTERVAL = SERVICE_CONFIG.get("inbox_lease_renew_interval", INBOX_LEASE_SECONDS / 3)
+INBOX_MAX_ATTEMPTS = SERVICE_CONFIG.get("inbox_max_attempts", 5)
+INBOX_FLUSH_ROWS = SERVICE_CONFIG.get("inbox_flush_rows", 100)
+INBOX_FLUSH_INTERVAL = SERVICE_CONFIG.get("inbox_flush_interval", 0.005)
+
+async def enqueue_webhook(conn, account_id: int, payload: dict):
+    await fetch(conn, "insert_inbox", *_inbox_record(account_id, payload))
+
+def _inbox_record(account_id: int, payload: dict) -> tuple:
+    return (account_id, payload["id"], payload)
+
+# Копит входящие вебхуки несколько миллисекунд и пишет их одним executemany.
+# add() возвращается только после записи пачки в БД, поэтому ответ 200 для Avito
+# по-прежнему означает сохраненное сообщение.
+class InboxWriter:
+    def __init__(self, flush_rows: int = INBOX_FLUSH_ROWS, flush_interval: float = INBOX_FLUSH_INTERVAL):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._timer = None
+        # Фоновые flush по таймеру: ссылки не дают сборщику мусора удалить задачи до завершения
+        self._flush_tasks = set()
+
+    async def add(self, account_id: int, payload: dict):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((_inbox_record(account_id, payload), future))
+        if len(self._pending) >= self.flush_rows:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+        await future
+
+    def _start_flush(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            console.log(f"[red]Ошибка фоновой записи вебхуков: {task.exception()}")
+            incr("inbox_writer.flush_errors")
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            async with get_pool().acquire() as conn:
+                await executemany(conn, "insert_inbox", [record for record, _ in batch])
+        except Exception as e:
+            console.log(f"[red]Ошибка записи пачки вебхуков ({len(batch)} шт.): {e}")
+            incr("inbox_writer.flush_errors")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        observe("inbox_writer.batch_size", len(batch))
+        observe("inbox_writer.flush_seconds", time.perf_counter() - started)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+
+inbox_writer = InboxWriter()
+
+async def claim_batch(conn, limit: int) -> list:
+    return await fetch(conn, "claim_inbox", limit, INBOX_LEASE_SECONDS)
+
+def inbox_delivery_key(inbox_id: int) -> uuid.UUID:
+    # Ключ доставки ответа выводится из строки inbox: повторная обработка того же сообщения
+    # находит уже сохраненный ответ, а не создает второй
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"webhook_inbox/{inbox_id}")
+
+async def renew_lease(conn, inbox_id: int):
+    await conn.execute(
+        """
+        UPDATE webhook_inbox SET available_at = NOW() + make_interval(secs => $2)
+        WHERE id = $1 AND status = 'processing'
+        """,
+        inbox_id, INBOX_LEASE_SECONDS
+    )
+
+async def mark_done(conn, inbox_id: int):
+    await conn.execute(
+        "UPDATE webhook_inbox SET status = 'done', last_error = NULL, processed_at = NOW() WHERE id = $1",
+        inbox_id
+    )
+
+async def mark_failed(conn, inbox_id: int, attempts: int, error: str):
+    if attempts >= INBOX_MAX_ATTEMPTS:
+        await conn.execute(
+            "UPDATE webhook_inbox SET status = 'failed', last_error = $2, processed_at = NOW() WHERE id = $1",
+            inbox_id, error
+        )
+        return
+    # Экспоненциальная задержка перед повтором: 2, 4, 8... секунд
+    await conn.execute(
+        """
+        UPDATE webhook_inbox
+        SET status = 'pending', last_error = $2, available_at = NOW() + make_interval(secs => $3)
+        WHERE id = $1
+        """,
+        inbox_id, error, 2 ** attempts
+    )
+
+async def handle_webhook(conn, account_id: int, payload: dict, inbox_id: int = None):
+    # Собственные сообщения аккаунта (ответы бота) не обрабатываем
+    if payload.get("author_id") == payload.get("user_id"):
+        return
+    text = (payload.get("content") or {}).get("text")
+    if not text:
+        return
+
+    row = await conn.fetchrow(
+        """
+        SELECT b.id AS bot_id, u.id, u.telegram_id
+        FROM tokens t
+        JOIN bots b ON b.id = t.bot_id
+        JOIN users u ON u.id = b.user_id
+        WHERE t.account_id = $1 AND b.status = 'active'
+        LIMIT 1
+        """,
+        account_id
+    )
+    if not row:
+        console.log(f"[yellow]No active bot for Avito account #{account_id}, message {payload.get('id')} skipped")
+        return
+
+    message = {"text": text, "user_id": account_id, "chat_id": payload.get("chat_id")}
+    user = {"id": row["id"], "telegram_id": row["telegram_id"]}
+    if inbox_id is None:
+        await process_avito_message(row["bot_id"], message, conn, user)
+        return
+
+    async def finish(conn):
+        await mark_done(conn, inbox_id)
+
+    # Ответ и отметка о выполнении пишутся одной транзакцией
+    await process_avito_message(
+        row["bot_id"], message, conn, user, delivery_key=inbox_delivery_key(inbox_id), on_saved=finish
+    )
+
+async def _handle_row(conn, row):
+    await handle_webhook(conn, row["account_id"], row["payload"], inbox_id=row["id"])
+
+async def _mark_row_done(conn, row):
+    await mark_done(conn, row["id"])
+
+async def _mark_row_failed(conn, row, error: str):
+    await mark_failed(conn, row["id"], row["attempts"], error)
+
+async def _renew_row(conn, row):
+    await renew_lease(conn, row["id"])
+
+async def run_inbox_workers(pool, concurrency: int = INBOX_CONCURRENCY):
+    queue = LeaseQueue(
+        "Inbox", claim=claim_batch, handle=_handle_row, mark_done=_mark_row_done, mark_failed=_mark_row_failed,
+        renew=_renew_row, renew_interval=INBOX_LEASE_RENEW_INTERVAL, concurrency=concurrency, batch_size=INBOX_BATCH_SIZE, poll_interval=INBOX_POLL_INTERVAL
+    )
+    await queue.run(pool)
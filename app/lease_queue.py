@@ -0,0 +1,81 @@
+import asyncio
+from rich.console import Console
+
+console = Console()
+
+# Воркер очереди в таблице с арендой строк (webhook_inbox, исходящие сообщения).
+# Один цикл забирает пачки строк claim-запросом, но не больше, чем есть свободных обработчиков;
+# concurrency обработчиков разбирают их. Строка, которую не удалось обработать, уходит
+# в mark_failed на новом соединении; строка упавшего процесса вернется по истечении аренды.
+# Если задан renew, аренда продлевается каждые renew_interval секунд, пока строка обрабатывается,
+# чтобы долгий обработчик не потерял строку и ее не забрал второй воркер.
+# claim(conn, limit) -> строки, handle(conn, row), mark_done(conn, row), mark_failed(conn, row, error),
+# renew(conn, row)
+class LeaseQueue:
+    def __init__(
+        self, name: str, claim, handle, mark_failed, mark_done=None, renew=None, renew_interval: float = 60.0,
+        concurrency: int = 8, batch_size: int = 16, poll_interval: float = 1.0
+    ):
+        self.name = name
+        self.claim = claim
+        self.handle = handle
+        self.mark_failed = mark_failed
+        self.mark_done = mark_done
+        self.renew = renew
+        self.renew_interval = renew_interval
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    async def process(self, pool, row):
+        renewer = asyncio.ensure_future(self._renew_loop(pool, row)) if self.renew is not None else None
+        try:
+            async with pool.acquire() as conn:
+                await self.handle(conn, row)
+                if self.mark_done is not None:
+                    await self.mark_done(conn, row)
+        except Exception as e:
+            console.log(f"[red]{self.name}: ошибка обработки строки #{row['id']}: {e}")
+            async with pool.acquire() as conn:
+                await self.mark_failed(conn, row, str(e))
+        finally:
+            if renewer is not None:
+                renewer.cancel()
+
+    async def _renew_loop(self, pool, row):
+        # Соединение обработчика занято, поэтому аренда продлевается на отдельном
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                async with pool.acquire() as conn:
+                    await self.renew(conn, row)
+            except Exception as e:
+                console.log(f"[yellow]{self.name}: не удалось продлить аренду строки #{row['id']}: {e}")
+
+    async def _fetch_loop(self, pool, queue: asyncio.Queue):
+        while True:
+            free_slots = queue.maxsize - queue.qsize()
+            rows = []
+            if free_slots > 0:
+                async with pool.acquire() as conn:
+                    rows = await self.claim(conn, min(free_slots, self.batch_size))
+                for row in rows:
+                    await queue.put(row)
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _consume_loop(self, pool, queue: asyncio.Queue):
+        while True:
+            row = await queue.get()
+            try:
+                await self.process(pool, row)
+            finally:
+                queue.task_done()
+
+    async def run(self, pool):
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        console.log(f"[green]{self.name} worker started, concurrency={self.concurrency}")
+        await asyncio.gather(
+            self._fetch_loop(pool, queue),
+            *(self._consume_loop(pool, queue) for _ in range(self.concurrency))
+        )
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from .metrics import incr, observe
+
+class LLMOverloaded(Exception):
+    pass
+
+# Очередь вызовов LLM одного процесса: не больше max_in_flight запросов одновременно.
+# Ожидающие делятся по приоритетам (live, test, background), между приоритетами —
+# взвешенный round-robin, внутри приоритета — по очереди между пользователями,
+# чтобы один владелец с пачкой запросов не занимал все слоты. Между процессами слоты не делятся:
+# лимиты для каждой роли процесса задаются в app/models/deepseek.py.
+# Переполненная очередь или слишком долгое ожидание дают LLMOverloaded: вызывающий код
+# откладывает работу (повтор из inbox, пропуск обновления краткого содержания) или отвечает 503
+class LLMScheduler:
+    def __init__(self, max_in_flight: int, weights: dict, max_queued: dict, max_wait: dict):
+        self.max_in_flight = max_in_flight
+        self.weights = weights
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.in_flight = 0
+        # приоритет -> OrderedDict(пользователь -> deque ожидающих future)
+        self._waiters = {priority: OrderedDict() for priority in weights}
+        self._queued = {priority: 0 for priority in weights}
+        self._credit = {priority: 0 for priority in weights}
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "live", user_key=None):
+        await self.acquire(priority, user_key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: str, user_key=None):
+        if priority not in self.weights:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+        # Без очереди — только если никто не ждет, иначе новые запросы обгоняли бы очередь
+        if self.in_flight < self.max_in_flight and not any(self._queued.values()):
+            self.in_flight += 1
+            observe(f"llm.queue_wait_seconds.{priority}", 0.0)
+            return
+        if self._queued[priority] >= self.max_queued[priority]:
+            incr(f"llm.shed.{priority}")
+            raise LLMOverloaded(f"Очередь LLM ({priority}) переполнена")
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters[priority].setdefault(user_key, deque()).append(future)
+        self._queued[priority] += 1
+        # Не asyncio.wait_for: он проглатывает отмену, если слот выдан в тот же момент
+        timer = loop.call_later(self.max_wait[priority], self._expire, priority, user_key, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Слот выдан одновременно с отменой — возвращаем его
+                self.release()
+            else:
+                self._forget(priority, user_key, future)
+            raise
+        finally:
+            timer.cancel()
+        observe(f"llm.queue_wait_seconds.{priority}", time.perf_counter() - started)
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def queued(self) -> dict:
+        return dict(self._queued)
+
+    def _expire(self, priority: str, user_key, future):
+        # Ожидание убирается из очереди сразу, в момент истечения, а не когда задача проснется
+        if future.done():
+            return
+        self._forget(priority, user_key, future)
+        incr(f"llm.shed.{priority}")
+        future.set_exception(LLMOverloaded(f"Слишком долгое ожидание LLM ({priority})"))
+
+    def _forget(self, priority: str, user_key, future):
+        waiters = self._waiters[priority].get(user_key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self._queued[priority] -= 1
+            if not waiters:
+                del self._waiters[priority][user_key]
+
+    def _pick(self):
+        # Плавный взвешенный round-robin (как в nginx) среди непустых приоритетов
+        active = [priority for priority in self.weights if self._queued[priority]]
+        if not active:
+            return None
+        for priority in active:
+            self._credit[priority] += self.weights[priority]
+        best = max(active, key=lambda priority: self._credit[priority])
+        self._credit[best] -= sum(self.weights[priority] for priority in active)
+        return best
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight:
+            priority = self._pick()
+            if priority is None:
+                return
+            users = self._waiters[priority]
+            user_key, waiters = next(iter(users.items()))
+            future = waiters.popleft()
+            # Пользователь уходит в конец очереди своего приоритета
+            del users[user_key]
+            if waiters:
+                users[user_key] = waiters
+            self._queued[priority] -= 1
+            if future.done():
+                # Задача ожидающего отменена (Task.cancel отменяет и future), но еще не проснулась
+                # и не убрала себя из очереди — слот достается следующему
+                continue
+            future.set_result(None)
+            self.in_flight += 1
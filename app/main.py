@@ -1,10 +1,17 @@
-from fastapi import Depends, FastAPI, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+import secrets
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.exception_handlers import http_exception_handler
-from .auth import get_current_user_from_cookie, get_current_user_from_token, login_for_access_token
+from .auth import get_current_user_from_cookie, login_for_access_token, on_user_changed_notify
 from .database import init_pool, close_pool, get_db_connection
+from .models.deepseek import close_llm_client, llm_queue_stats
+from .inbox import inbox_writer
+from .events import register_handler, start_listener, stop_listener
+from .models.prompt import on_bot_config_notify
+from .models.avito_client import init_avito_client, close_avito_client
+from .models.avito_tokens import on_avito_token_notify
+from .metrics import snapshot as metrics_snapshot
 from .routes.bots_index import router as bots_index_router
 from .routes.bots_create import router as bots_create_router
 from .routes.bots_edit import router as bots_edit_router
@@ -22,14 +29,15 @@ from .routes.oauth_select_items_get import router as oauth_select_items_get_rout
 from .routes.oauth_select_items_post import router as oauth_select_items_post_router
 from .routes.avito_webhook import router as avito_webhook_router
 from .config import COOKIE_NAME, SERVICE_CONFIG, TELEGRAM_BOT_NAME
-from .utils import send_notification
-import asyncio
-import datetime as dt
 from rich.console import Console
 from .templates_config import templates
 
 console = Console()
 
+# /metrics отдает глубину очередей, расход токенов и тайминги — только с заголовком
+# Authorization: Bearer <metrics_token>. Без настроенного токена эндпоинт выключен
+METRICS_TOKEN = SERVICE_CONFIG.get("metrics_token")
+
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -44,41 +52,35 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
 async def startup_event():
     await init_pool()
     console.log("[green]Database pool initialized")
-    asyncio.create_task(charge_balance())
+    await init_avito_client()
+    register_handler("bot_config", on_bot_config_notify)
+    register_handler("avito_token", on_avito_token_notify)
+    register_handler("user_changed", on_user_changed_notify)
+    await start_listener()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Дописываем накопленные вебхуки до закрытия пула
+    await inbox_writer.close()
+    await stop_listener()
+    await close_avito_client()
+    await close_llm_client()
     await close_pool()
 
-async def charge_balance():
-    from .database import _pool
-    while True:
-        async with _pool.acquire() as conn:
-            users = await conn.fetch("SELECT * FROM users")
-            for user in users:
-                bots = await conn.fetch("SELECT * FROM bots WHERE user_id = $1 AND status = 'active'", user["id"])
-                if not bots:
-                    continue
-                trial_active = user["trial_end_date"] > dt.datetime.utcnow()
-                total_cost = len(bots) * SERVICE_CONFIG["bot_daily_cost"]
-                
-                if trial_active and len(bots) == 1:
-                    continue
-                
-                if user["balance"] < total_cost:
-                    for bot in bots:
-                        await conn.execute("UPDATE bots SET status = 'stopped' WHERE id = $1", bot["id"])
-                        await send_notification(user["telegram_id"], f"Баланс недостаточен для бота #{bot['id']}. Пополните баланс.", conn)
-                else:
-                    await conn.execute("UPDATE users SET balance = balance - $1 WHERE id = $2", total_cost, user["id"])
-        
-        await asyncio.sleep(86400)
-
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request, conn=Depends(get_db_connection)):
     user = await get_current_user_from_cookie(request, conn)
     return templates.TemplateResponse("index.html", {"request": request, "user": user, "config": {"TELEGRAM_BOT_NAME": TELEGRAM_BOT_NAME}})
 
+@app.get("/metrics", response_class=JSONResponse)
+async def metrics(authorization: str = Header(default="")):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404)
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=403)
+    return {**metrics_snapshot(), "llm_queue": llm_queue_stats()}
+
 @app.get("/auth/login", response_class=HTMLResponse)
 async def login_get(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "errors": []})
@@ -96,11 +98,14 @@ async def login_post(request: Request, conn=Depends(get_db_connection)):
     if not errors:
         try:
             response = RedirectResponse("/", status_code=status.HTTP_302_FOUND)
-            await login_for_access_token(response=response, username=username, password=password, conn=conn)
+            await login_for_access_token(
+                response=response, username=username, password=password, conn=conn,
+                client_ip=request.client.host if request.client else None
+            )
             console.log("[green]Login successful")
             return response
-        except HTTPException:
-            errors.append("Неверный логин или пароль")
+        except HTTPException as e:
+            errors.append(e.detail if e.status_code == 429 else "Неверный логин или пароль")
     return templates.TemplateResponse("login.html", {"request": request, "errors": errors})
 
 @app.get("/auth/logout", response_class=HTMLResponse)
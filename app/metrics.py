@@ -0,0 +1,21 @@
+from collections import defaultdict
+
+# Простые метрики процесса: счетчики и сводки (count/sum/max) по наблюдениям
+_counters = defaultdict(int)
+_summaries = {}
+
+def incr(name: str, value: int = 1):
+    _counters[name] += value
+
+def observe(name: str, value: float):
+    summary = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+    summary["count"] += 1
+    summary["sum"] += value
+    summary["max"] = max(summary["max"], value)
+
+def snapshot() -> dict:
+    summaries = {
+        name: {**summary, "avg": summary["sum"] / summary["count"] if summary["count"] else 0.0}
+        for name, summary in _summaries.items()
+    }
+    return {"counters": dict(_counters), "summaries": summaries}
@@ -0,0 +1,172 @@
+import asyncio
+import datetime as dt
+from fastapi import HTTPException
+from rich.console import Console
+from ..config import AVITO_API_URL_ITEMS, SERVICE_CONFIG
+from ..database import get_pool
+from .avito_client import avito_request
+from .avito_tokens import get_valid_token
+
+console = Console()
+
+CATALOG_PAGE_SIZE = SERVICE_CONFIG.get("catalog_page_size", 100)
+CATALOG_CONCURRENCY = SERVICE_CONFIG.get("catalog_concurrency", 4)
+# Каталог старше этого возраста обновляется в фоне при открытии страницы выбора объявлений
+CATALOG_MAX_AGE = SERVICE_CONFIG.get("catalog_max_age", 900)
+CATALOG_FULL_SYNC_INTERVAL = SERVICE_CONFIG.get("catalog_full_sync_interval", 86400)
+CATALOG_FIRST_SYNC_TIMEOUT = SERVICE_CONFIG.get("catalog_first_sync_timeout", 20)
+# Пространство ключей pg_try_advisory_lock(namespace, bot_id) для синхронизации каталога
+CATALOG_LOCK_NAMESPACE = 1002
+
+UPSERT_ITEM_SQL = """
+    INSERT INTO avito_items (bot_id, item_id, title, price, status, url, data, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, NOW())
+    ON CONFLICT (bot_id, item_id) DO UPDATE
+    SET title = EXCLUDED.title, price = EXCLUDED.price, status = EXCLUDED.status,
+        url = EXCLUDED.url, data = EXCLUDED.data, updated_at = NOW()
+"""
+
+# bot_id -> задача синхронизации, запущенная этим процессом
+_running = {}
+
+async def _fetch_page(access_token: str, page: int, updated_from: dt.date = None) -> list:
+    params = {"per_page": CATALOG_PAGE_SIZE, "page": page}
+    if updated_from:
+        params["updatedAtFrom"] = updated_from.isoformat()
+    response = await avito_request(
+        "GET",
+        AVITO_API_URL_ITEMS,
+        params=params,
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Ошибка получения объявлений Avito: {response.status_code}")
+    return response.json().get("resources", [])
+
+async def _store_page(pool, bot_id: int, items: list):
+    if not items:
+        return
+    async with pool.acquire() as conn:
+        await conn.executemany(UPSERT_ITEM_SQL, [
+            (
+                bot_id, item["id"], item.get("title"), item.get("price"), item.get("status"), item.get("url"), item
+            )
+            for item in items
+        ])
+
+async def sync_catalog(pool, bot_id: int) -> int:
+    async with pool.acquire() as lock_conn:
+        # Синхронизацию одного бота выполняет только один процесс в кластере
+        if not await lock_conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", CATALOG_LOCK_NAMESPACE, bot_id):
+            return 0
+        try:
+            state = await lock_conn.fetchrow("SELECT * FROM avito_catalog_sync WHERE bot_id = $1", bot_id)
+            started_at = await lock_conn.fetchval("SELECT NOW()::timestamp")
+            full_sync = (
+                not state or not state["full_synced_at"]
+                or state["full_synced_at"] < started_at - dt.timedelta(seconds=CATALOG_FULL_SYNC_INTERVAL)
+            )
+            # Дельта по дате изменения (API принимает только дату, берем с запасом в сутки)
+            updated_from = None if full_sync else (state["synced_at"] - dt.timedelta(days=1)).date()
+            access_token = await get_valid_token(bot_id, lock_conn)
+
+            total = 0
+            page = 1
+            while True:
+                # Страницы читаются окнами по CATALOG_CONCURRENCY параллельных запросов
+                # и пишутся в БД сразу, не накапливаясь в памяти
+                pages = await asyncio.gather(*(
+                    _fetch_page(access_token, number, updated_from)
+                    for number in range(page, page + CATALOG_CONCURRENCY)
+                ))
+                for items in pages:
+                    await _store_page(pool, bot_id, items)
+                    total += len(items)
+                if len(pages[-1]) < CATALOG_PAGE_SIZE:
+                    break
+                page += CATALOG_CONCURRENCY
+
+            if full_sync:
+                await lock_conn.execute(
+                    "DELETE FROM avito_items WHERE bot_id = $1 AND updated_at < $2", bot_id, started_at
+                )
+            await lock_conn.execute(
+                """
+                INSERT INTO avito_catalog_sync (bot_id, synced_at, full_synced_at, item_count, last_error)
+                VALUES ($1, $2, $3, (SELECT COUNT(*) FROM avito_items WHERE bot_id = $1), NULL)
+                ON CONFLICT (bot_id) DO UPDATE
+                SET synced_at = $2, full_synced_at = COALESCE($3, avito_catalog_sync.full_synced_at),
+                    item_count = EXCLUDED.item_count, last_error = NULL
+                """,
+                bot_id, started_at, started_at if full_sync else None
+            )
+            console.log(f"[green]Каталог бота #{bot_id} синхронизирован: {total} объявлений ({'полная' if full_sync else 'дельта'})")
+            return total
+        except Exception as e:
+            await lock_conn.execute(
+                """
+                INSERT INTO avito_catalog_sync (bot_id, last_error) VALUES ($1, $2)
+                ON CONFLICT (bot_id) DO UPDATE SET last_error = $2
+                """,
+                bot_id, str(e)
+            )
+            raise
+        finally:
+            await lock_conn.execute("SELECT pg_advisory_unlock($1, $2)", CATALOG_LOCK_NAMESPACE, bot_id)
+
+async def _sync_in_background(bot_id: int) -> int:
+    try:
+        return await sync_catalog(get_pool(), bot_id)
+    except Exception as e:
+        console.log(f"[red]Ошибка синхронизации каталога бота #{bot_id}: {e}")
+        raise
+
+def start_sync(bot_id: int) -> asyncio.Task:
+    task = _running.get(bot_id)
+    if task is None or task.done():
+        task = _running[bot_id] = asyncio.create_task(_sync_in_background(bot_id))
+    return task
+
+async def ensure_catalog(conn, bot_id: int):
+    state = await conn.fetchrow(
+        "SELECT synced_at, NOW()::timestamp - synced_at AS age FROM avito_catalog_sync WHERE bot_id = $1", bot_id
+    )
+    if not state or state["synced_at"] is None:
+        # Первая загрузка: показывать нечего, ждем (но не дольше таймаута)
+        try:
+            await asyncio.wait_for(asyncio.shield(start_sync(bot_id)), CATALOG_FIRST_SYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            console.log(f"[yellow]Первая синхронизация каталога бота #{bot_id} продолжается в фоне")
+        return
+    if state["age"] > dt.timedelta(seconds=CATALOG_MAX_AGE):
+        start_sync(bot_id)
+
+async def catalog_synced(conn, bot_id: int) -> bool:
+    # Каталог хотя бы раз загружен полностью: пустой кэш после этого значит, что объявлений нет
+    return await conn.fetchval(
+        "SELECT synced_at IS NOT NULL FROM avito_catalog_sync WHERE bot_id = $1", bot_id
+    ) or False
+
+async def get_cached_items(conn, bot_id: int) -> list:
+    rows = await conn.fetch(
+        "SELECT item_id AS id, title, price, status, url FROM avito_items WHERE bot_id = $1 ORDER BY title, item_id",
+        bot_id
+    )
+    return [dict(row) for row in rows]
+
+async def sync_stale_catalogs(pool):
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT b.id FROM bots b
+            LEFT JOIN avito_catalog_sync s ON s.bot_id = b.id
+            WHERE b.is_authorized = TRUE
+              AND (s.synced_at IS NULL OR s.synced_at < NOW()::timestamp - make_interval(secs => $1))
+            """,
+            CATALOG_MAX_AGE
+        )
+    for row in rows:
+        try:
+            await sync_catalog(pool, row["id"])
+        except Exception as e:
+            console.log(f"[red]Ошибка синхронизации каталога бота #{row['id']}: {e}")
@@ -0,0 +1,89 @@
+import asyncio
+import random
+import time
+import httpx
+from rich.console import Console
+from ..config import SERVICE_CONFIG
+
+console = Console()
+
+AVITO_MAX_CONNECTIONS = SERVICE_CONFIG.get("avito_max_connections", 20)
+AVITO_MAX_KEEPALIVE = SERVICE_CONFIG.get("avito_max_keepalive", 10)
+AVITO_TIMEOUT = SERVICE_CONFIG.get("avito_timeout", 15.0)
+AVITO_MAX_RETRIES = SERVICE_CONFIG.get("avito_max_retries", 3)
+AVITO_BACKOFF_BASE = SERVICE_CONFIG.get("avito_backoff_base", 0.5)
+# HTTP/2 требует пакет h2
+AVITO_HTTP2 = SERVICE_CONFIG.get("avito_http2", False)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Без явного retry=True повторяются только идемпотентные запросы: повтор POST после потерянного
+# ответа может отправить сообщение покупателю дважды или повторно предъявить уже использованный refresh_token
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+_client = None
+# Avito вернул X-RateLimit-Remaining: 0 — новые запросы ждут до этого момента
+_paused_until = 0.0
+
+async def init_avito_client():
+    get_avito_client()
+
+def get_avito_client() -> httpx.AsyncClient:
+    # Клиент живет все время работы процесса: TCP/TLS-соединения к Avito переиспользуются
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=AVITO_HTTP2,
+            timeout=AVITO_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=AVITO_MAX_CONNECTIONS,
+                max_keepalive_connections=AVITO_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+async def close_avito_client():
+    global _client
+    if _client:
+        await _client.aclose()
+        _client = None
+
+def _retry_delay(response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Экспоненциальная задержка с джиттером, чтобы воркеры не повторяли запросы синхронно
+    return AVITO_BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+
+def _track_rate_limit(response):
+    global _paused_until
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        _paused_until = max(_paused_until, time.monotonic() + _retry_delay(response, 0))
+
+async def avito_request(method: str, url: str, retry: bool = None, **kwargs) -> httpx.Response:
+    client = get_avito_client()
+    if retry is None:
+        retry = method.upper() in IDEMPOTENT_METHODS
+    max_retries = AVITO_MAX_RETRIES if retry else 0
+    for attempt in range(max_retries + 1):
+        pause = _paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            console.log(f"[yellow]Avito {method} {url} failed: {e}, retrying")
+            await asyncio.sleep(_retry_delay(None, attempt))
+            continue
+
+        _track_rate_limit(response)
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+        console.log(f"[yellow]Avito {method} {url} returned {response.status_code}, retrying")
+        await asyncio.sleep(_retry_delay(response, attempt))
+    return response
@@ -0,0 +1,117 @@
+import asyncio
+import datetime as dt
+from fastapi import HTTPException
+from rich.console import Console
+from ..config import AVITO_TOKEN_URL, AVITO_CLIENT_ID, AVITO_CLIENT_SECRET, SERVICE_CONFIG
+from .avito_client import avito_request
+
+console = Console()
+
+# Токен обновляется заранее, за столько секунд до истечения
+TOKEN_REFRESH_MARGIN = SERVICE_CONFIG.get("avito_token_refresh_margin", 300)
+TOKEN_REFRESH_INTERVAL = SERVICE_CONFIG.get("avito_token_refresh_interval", 60)
+# Пространство ключей pg_advisory_xact_lock(namespace, bot_id) для обновления токенов
+TOKEN_LOCK_NAMESPACE = 1001
+
+# bot_id -> {"access_token": ..., "expires_at": ...}
+_tokens = {}
+_locks = {}
+
+def _is_fresh(expires_at: dt.datetime) -> bool:
+    return expires_at - dt.timedelta(seconds=TOKEN_REFRESH_MARGIN) > dt.datetime.utcnow()
+
+async def refresh_avito_token(refresh_token: str) -> dict:
+    response = await avito_request(
+        "POST",
+        AVITO_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": AVITO_CLIENT_ID,
+            "client_secret": AVITO_CLIENT_SECRET
+        }
+    )
+    if response.status_code != 200:
+        console.log(f"[red]Ошибка обновления токена Avito: {response.status_code}, {response.text}")
+        raise HTTPException(status_code=400, detail="Ошибка обновления токена Avito")
+    return response.json()
+
+async def _load_or_refresh(bot_id: int, conn) -> str:
+    # Advisory lock гарантирует, что во всем кластере токен бота обновляет только один процесс;
+    # остальные после ожидания видят уже обновленную строку
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1, $2)", TOKEN_LOCK_NAMESPACE, bot_id)
+        token = await conn.fetchrow(
+            "SELECT access_token, refresh_token, expires_at FROM tokens WHERE bot_id = $1", bot_id
+        )
+        if not token:
+            raise HTTPException(status_code=400, detail="Токен для бота не найден")
+
+        if _is_fresh(token["expires_at"]):
+            _tokens[bot_id] = {"access_token": token["access_token"], "expires_at": token["expires_at"]}
+            return token["access_token"]
+
+        try:
+            token_data = await refresh_avito_token(token["refresh_token"])
+        except HTTPException:
+            # Старый токен еще жив — отдаем его, обновим на следующей попытке
+            if token["expires_at"] > dt.datetime.utcnow():
+                return token["access_token"]
+            raise
+
+        expires_at = dt.datetime.utcnow() + dt.timedelta(seconds=token_data["expires_in"])
+        await conn.execute(
+            """
+            UPDATE tokens 
+            SET access_token = $1, refresh_token = $2, expires_at = $3
+            WHERE bot_id = $4
+            """,
+            token_data["access_token"], token_data.get("refresh_token") or token["refresh_token"], expires_at, bot_id
+        )
+        console.log(f"[green]Токен Avito для бота #{bot_id} обновлен")
+        _tokens[bot_id] = {"access_token": token_data["access_token"], "expires_at": expires_at}
+        return token_data["access_token"]
+
+async def get_valid_token(bot_id: int, conn) -> str:
+    cached = _tokens.get(bot_id)
+    if cached and _is_fresh(cached["expires_at"]):
+        return cached["access_token"]
+
+    # Одновременные запросы одного процесса ждут единственное обновление
+    lock = _locks.setdefault(bot_id, asyncio.Lock())
+    async with lock:
+        cached = _tokens.get(bot_id)
+        if cached and _is_fresh(cached["expires_at"]):
+            return cached["access_token"]
+        return await _load_or_refresh(bot_id, conn)
+
+def forget_token(bot_id: int = None):
+    if bot_id is None:
+        _tokens.clear()
+    else:
+        _tokens.pop(bot_id, None)
+
+async def notify_token_changed(conn, bot_id: int):
+    forget_token(bot_id)
+    await conn.execute("SELECT pg_notify('avito_token', $1)", str(bot_id))
+
+def on_avito_token_notify(payload: str):
+    forget_token(int(payload) if payload else None)
+
+async def refresh_expiring_tokens(pool):
+    async with pool.acquire() as conn:
+        bot_ids = await conn.fetch(
+            """
+            SELECT t.bot_id FROM tokens t
+            JOIN bots b ON b.id = t.bot_id
+            WHERE b.status = 'active' AND t.expires_at < NOW() AT TIME ZONE 'UTC' + make_interval(secs => $1)
+            """,
+            TOKEN_REFRESH_MARGIN
+        )
+    for row in bot_ids:
+        forget_token(row["bot_id"])
+        try:
+            async with pool.acquire() as conn:
+                await get_valid_token(row["bot_id"], conn)
+        except Exception as e:
+            console.log(f"[red]Не удалось обновить токен Avito для бота #{row['bot_id']}: {e}")
@@ -0,0 +1,22 @@
+from typing import Optional
+from fastapi import Depends, HTTPException
+from rich.console import Console
+from ..auth import get_current_user_claims
+from ..database import get_db_connection
+from ..queries import fetchrow
+
+console = Console()
+
+async def fetch_owned_bot(conn, bot_id: int, user_id: int) -> Optional[dict]:
+    row = await fetchrow(conn, "owned_bot", bot_id, user_id)
+    return dict(row) if row else None
+
+async def get_owned_bot(
+    bot_id: int, user: dict = Depends(get_current_user_claims), conn=Depends(get_db_connection)
+) -> dict:
+    # FastAPI кэширует зависимость в пределах запроса: повторный Depends(get_owned_bot) запрос не повторяет
+    bot = await fetch_owned_bot(conn, bot_id, user["id"])
+    if not bot:
+        console.log(f"[red]Бот #{bot_id} не найден для пользователя #{user['id']}")
+        raise HTTPException(status_code=404, detail="Бот не найден")
+    return bot
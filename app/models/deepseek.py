@@ -1,63 +1,219 @@
 import json
-from openai import OpenAI
-from ..config import DS_API_KEY, DS_API_URL
+import time
+from contextlib import aclosing
+import httpx
+from openai import AsyncOpenAI
+from ..config import DS_API_KEY, DS_API_URL, SERVICE_CONFIG
+from ..llm_scheduler import LLMOverloaded, LLMScheduler
+from ..metrics import incr
+from .prompt import REPLY_FORMAT_PROMPT
+from .streaming import REPLY_SCHEMA, MalformedReply, ReplyParser
 from rich.console import Console
 
 console = Console()
 
-async def query_deepseek(prompt: str, message: str, previous_messages: list, conn, telegram_id: str) -> dict:
-    client = OpenAI(api_key=DS_API_KEY, base_url=DS_API_URL)
-    
-    # Формируем историю сообщений
-    messages = [{"role": "system", "content": prompt}]
+# Настройки клиента LLM (можно переопределить в SERVICE_CONFIG)
+LLM_MAX_CONNECTIONS = SERVICE_CONFIG.get("llm_max_connections", 100)
+LLM_MAX_KEEPALIVE = SERVICE_CONFIG.get("llm_max_keepalive", 20)
+# Очередь LLM своя в каждом процессе, и приоритеты ниже решают только внутри него. Живые ответы
+# Avito идут из app.worker, тестовый режим — из веб-воркеров, поэтому лимит одновременных запросов
+# задается отдельно для каждой роли процесса: всплеск тестового режима не занимает слоты живых диалогов.
+# К DeepSeek одновременно идет до worker × копий app.worker + web × веб-воркеров запросов —
+# эта сумма должна укладываться в лимит аккаунта
+LLM_MAX_CONCURRENCY = SERVICE_CONFIG.get("llm_max_concurrency", {"worker": 40, "web": 4})
+# Приоритеты очереди LLM: живые диалоги Avito, тестовый режим, фоновое краткое содержание
+LLM_PRIORITY_WEIGHTS = SERVICE_CONFIG.get("llm_priority_weights", {"live": 6, "test": 3, "background": 1})
+LLM_MAX_QUEUED = SERVICE_CONFIG.get("llm_max_queued", {"live": 500, "test": 50, "background": 100})
+LLM_MAX_WAIT = SERVICE_CONFIG.get("llm_max_wait", {"live": 60.0, "test": 20.0, "background": 120.0})
+LLM_CONNECT_TIMEOUT = SERVICE_CONFIG.get("llm_connect_timeout", 5.0)
+LLM_READ_TIMEOUT = SERVICE_CONFIG.get("llm_read_timeout", 60.0)
+
+_client = None
+_scheduler = None
+_process_role = "web"
+
+def set_llm_process_role(role: str):
+    # Вызывается при старте процесса до первого запроса к LLM
+    global _process_role, _scheduler
+    _process_role = role
+    _scheduler = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        limit = LLM_MAX_CONCURRENCY
+        if isinstance(limit, dict):
+            limit = limit[_process_role]
+        _scheduler = LLMScheduler(limit, LLM_PRIORITY_WEIGHTS, LLM_MAX_QUEUED, LLM_MAX_WAIT)
+    return _scheduler
+
+def get_llm_client() -> AsyncOpenAI:
+    # Один клиент на процесс: соединения к DeepSeek переиспользуются (keep-alive)
+    global _client
+    if _client is None:
+        timeout = httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            ),
+        )
+        _client = AsyncOpenAI(api_key=DS_API_KEY, base_url=DS_API_URL, timeout=timeout, max_retries=0, http_client=http_client)
+    return _client
+
+async def close_llm_client():
+    global _client
+    if _client:
+        await _client.close()
+        _client = None
+
+def llm_queue_stats() -> dict:
+    scheduler = get_llm_scheduler()
+    return {
+        "role": _process_role, "max_in_flight": scheduler.max_in_flight,
+        "in_flight": scheduler.in_flight, "queued": scheduler.queued(),
+    }
+
+async def create_chat_completion(priority: str = "live", user_key=None, **kwargs):
+    async with get_llm_scheduler().slot(priority, user_key):
+        return await get_llm_client().chat.completions.create(**kwargs)
+
+def usage_counts(usage, started: float) -> dict:
+    # DeepSeek отдает попадания в кэш контекста как prompt_cache_hit_tokens,
+    # OpenAI-совместимые API — как prompt_tokens_details.cached_tokens
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": cached or 0,
+        "completion_tokens": usage.completion_tokens,
+        "latency_ms": int((time.perf_counter() - started) * 1000),
+    }
+
+async def record_usage(conn, bot_id: int, kind: str, is_test: bool, usage: dict):
+    incr("llm.prompt_tokens", usage["prompt_tokens"])
+    incr("llm.cached_tokens", usage["cached_tokens"])
+    incr("llm.completion_tokens", usage["completion_tokens"])
+    await conn.execute(
+        """
+        INSERT INTO llm_usage (bot_id, kind, is_test, prompt_tokens, cached_tokens, completion_tokens, latency_ms)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """,
+        bot_id, kind, is_test, usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"],
+        usage["latency_ms"]
+    )
+
+async def stream_chat_completion(usage: dict = None, priority: str = "live", user_key=None, **kwargs):
+    # Отдает куски текста ответа по мере генерации; слот очереди LLM занят до конца потока.
+    # Если передан usage, в него записываются токены из последнего куска потока
+    async with get_llm_scheduler().slot(priority, user_key):
+        started = time.perf_counter()
+        if usage is not None:
+            kwargs["stream_options"] = {"include_usage": True}
+        stream = await get_llm_client().chat.completions.create(stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                if chunk.usage and usage is not None:
+                    usage.update(usage_counts(chunk.usage, started))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Закрытие соединения обрывает генерацию, если поток бросили раньше конца
+            await stream.close()
+
+async def iter_reply(schema: dict = REPLY_SCHEMA, **kwargs):
+    # Разбирает ответ модели по мере генерации: ("text", кусок поля response),
+    # ("field", (имя, значение)) для каждого закрытого поля верхнего уровня, ("usage", токены)
+    # и в конце ("reply", ответ). Некорректный JSON дает MalformedReply и сразу обрывает генерацию
+    parser = ReplyParser(schema)
+    usage = {}
+    async with aclosing(stream_chat_completion(usage=usage, **kwargs)) as stream:
+        async for delta in stream:
+            text = parser.feed(delta)
+            if text:
+                yield "text", text
+            for field in parser.pop_fields():
+                yield "field", field
+    if usage:
+        yield "usage", usage
+    yield "reply", parser.result()
+
+def build_messages(prompt: str, message: str, previous_messages: list, summary: str = "") -> list:
+    # Порядок — от самого стабильного к самому изменчивому, чтобы общий префикс запросов
+    # (формат ответа, промпт бота, краткое содержание, история) совпадал побайтно и попадал в кэш контекста DeepSeek
+    messages = [{"role": "system", "content": REPLY_FORMAT_PROMPT}, {"role": "system", "content": prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"Краткое содержание предыдущей части диалога:\n{summary}"})
     for msg in previous_messages:
         messages.append({"role": "user", "content": msg["text"]})
         if msg["response"]:
+            # Колонка jsonb приходит из пула уже декодированной, текстовая — строкой
             try:
-                json_response = json.loads(msg["response"])
+                json_response = json.loads(msg["response"]) if isinstance(msg["response"], str) else msg["response"]
                 messages.append({"role": "assistant", "content": json.dumps(json_response, ensure_ascii=False)})
-            except json.JSONDecodeError:
-                messages.append({"role": "assistant", "content": msg["response"]})
+            except (json.JSONDecodeError, TypeError):
+                messages.append({"role": "assistant", "content": str(msg["response"])})
     
     # Добавляем текущее сообщение
     messages.append({"role": "user", "content": message})
+    return messages
+
+def completion_params(messages: list) -> dict:
+    return {
+        "model": "deepseek-chat",
+        "messages": messages,
+        "response_format": {'type': 'json_object'},
+        "temperature": 1.0,
+    }
+
+def fallback_reply() -> dict:
+    return {
+        "response": "Свяжемся позже",
+        "actions": [],
+        "parameters": [],
+        "status": "Требуется ручная обработка"
+    }
+
+async def run_actions(conn, telegram_id: str, actions: list):
+    for action in actions:
+        if action.get("action") == "уведомить":
+            await conn.execute(
+                "INSERT INTO notifications (telegram_id, text, category, status, created_at) VALUES ($1, $2, 'action', 'pending', NOW())",
+                telegram_id,
+                action.get("value")
+            )
+            console.log(f"[green]Notification added: {action.get('value')}")
+
+async def query_deepseek(
+    prompt: str, message: str, previous_messages: list, conn, telegram_id: str, summary: str = "",
+    actions_done: bool = False, bot_id: int = None, is_test: bool = False
+) -> dict:
+    messages = build_messages(prompt, message, previous_messages, summary)
     
     for _ in range(2):
         try:
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                stream=False,
-                response_format={'type': 'json_object'},
-                temperature=1.0
-            )
-            raw_answer = response.choices[0].message.content
-            json_response = json.loads(raw_answer)
-            
-            # Проверяем наличие обязательных полей
-            if not all(key in json_response for key in ["response", "actions", "parameters"]):
-                console.log(f"[red]Invalid JSON format: {raw_answer}")
-                continue
-            
-            # Выполняем действия
-            for action in json_response.get("actions", []):
-                if action.get("action") == "уведомить":
-                    await conn.execute(
-                        "INSERT INTO notifications (telegram_id, text, status, created_at) VALUES ($1, $2, 'pending', NOW())",
-                        telegram_id,
-                        action.get("value")
-                    )
-                    console.log(f"[green]Notification added: {action.get('value')}")
-            
-            return json_response
-        except json.JSONDecodeError as e:
-            console.log(f"[red]JSON Parse Error: {e}, raw: {raw_answer}")
+            async for kind, value in iter_reply(
+                priority="test" if is_test else "live", user_key=telegram_id, **completion_params(messages)
+            ):
+                if kind == "field" and value[0] == "actions" and not actions_done:
+                    # Действия выполняются, как только закрыт массив actions, не дожидаясь конца ответа.
+                    # Повторная попытка их уже не дублирует
+                    await run_actions(conn, telegram_id, value[1])
+                    actions_done = True
+                elif kind == "usage" and bot_id is not None:
+                    await record_usage(conn, bot_id, "reply", is_test, value)
+                elif kind == "reply":
+                    return value
+        except MalformedReply as e:
+            incr("llm.malformed_replies")
+            console.log(f"[red]Invalid JSON format: {e}")
+        except LLMOverloaded:
+            # Не подменяем ответ заглушкой: inbox повторит сообщение позже, тестовый режим ответит 503
+            raise
         except Exception as e:
             console.log(f"[red]DeepSeek Error: {e}")
     
-    return {
-        "response": "Свяжемся позже",
-        "actions": [],
-        "parameters": [],
-        "status": "Требуется ручная обработка"
-    }
\ No newline at end of file
+    return fallback_reply()
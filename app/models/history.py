@@ -0,0 +1,138 @@
+import json
+import time
+from rich.console import Console
+from ..llm_scheduler import LLMOverloaded
+from .deepseek import create_chat_completion, record_usage, usage_counts
+
+console = Console()
+
+# Все сообщения тестового режима бота живут в одном чате
+TEST_CHAT_ID = "test"
+
+SUMMARY_BATCH_SIZE = 50
+
+SUMMARY_PROMPT = (
+    "Ты ведешь краткое содержание переписки продавца с покупателем на Avito. "
+    "Обнови текущее краткое содержание с учетом новых сообщений. "
+    "Сохрани важные факты: что интересует покупателя, договоренности, собранные данные. "
+    "Ответь только текстом краткого содержания."
+)
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка для русского текста: ~3 символа на токен
+    return len(text or "") // 3 + 1
+
+def response_text(raw_response) -> str:
+    if not raw_response:
+        return ""
+    try:
+        response = json.loads(raw_response) if isinstance(raw_response, str) else raw_response
+        return response.get("response", "")
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return str(raw_response)
+
+def fold_block(bot) -> int:
+    # Краткое содержание обновляется блоками: окно растет до history_turns + блок сообщений,
+    # затем старшие сворачиваются. Между свертками окно только дописывается в конец,
+    # и префикс запроса к модели (краткое содержание и начало истории) не меняется
+    return max(1, bot["history_turns"] // 2)
+
+async def _summary_state(conn, bot, chat_id: str):
+    return await conn.fetchrow(
+        "SELECT summary, summarized_until FROM chat_summaries WHERE bot_id = $1 AND chat_id = $2", bot["id"], chat_id
+    )
+
+async def load_history(conn, bot, chat_id: str, is_test: bool) -> dict:
+    # Окно начинается сразу после свернутой части диалога: все еще не свернутые сообщения,
+    # но не больше history_turns + блок сообщений и не больше history_token_budget токенов
+    state = await _summary_state(conn, bot, chat_id)
+    rows = await conn.fetch(
+        """
+        SELECT text, response, timestamp FROM messages
+        WHERE bot_id = $1 AND chat_id = $2 AND is_test = $3
+          AND timestamp > COALESCE($4, '-infinity'::timestamp)
+        ORDER BY timestamp DESC, id DESC
+        LIMIT $5
+        """,
+        bot["id"], chat_id, is_test, state["summarized_until"] if state else None,
+        bot["history_turns"] + fold_block(bot)
+    )
+    turns = []
+    budget = bot["history_token_budget"]
+    for row in rows:
+        cost = estimate_tokens(row["text"]) + estimate_tokens(response_text(row["response"]))
+        if turns and cost > budget:
+            break
+        budget -= cost
+        turns.append(row)
+    turns.reverse()
+
+    return {
+        "summary": state["summary"] if state else "",
+        "turns": turns,
+    }
+
+async def update_summary(conn, bot, chat_id: str, is_test: bool):
+    # Как только несвернутых сообщений набралось history_turns + блок, сворачиваем старшие,
+    # оставляя в окне последние history_turns
+    state = await _summary_state(conn, bot, chat_id)
+    summary = state["summary"] if state else ""
+    summarized_until = state["summarized_until"] if state else None
+
+    rows = await conn.fetch(
+        """
+        SELECT text, response, timestamp FROM messages
+        WHERE bot_id = $1 AND chat_id = $2 AND is_test = $3
+          AND timestamp > COALESCE($4, '-infinity'::timestamp)
+        ORDER BY timestamp ASC, id ASC
+        LIMIT $5
+        """,
+        bot["id"], chat_id, is_test, summarized_until, bot["history_turns"] + SUMMARY_BATCH_SIZE
+    )
+    if len(rows) < bot["history_turns"] + fold_block(bot):
+        return
+    rows = rows[:len(rows) - bot["history_turns"]]
+
+    dialog = "\n".join(
+        f"Покупатель: {row['text']}\nПродавец: {response_text(row['response'])}" for row in rows
+    )
+    try:
+        started = time.perf_counter()
+        response = await create_chat_completion(
+            priority="background",
+            user_key=bot["user_id"],
+            model="deepseek-chat",
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Текущее краткое содержание:\n{summary or '—'}\n\nНовые сообщения:\n{dialog}"},
+            ],
+            stream=False,
+            max_tokens=bot["summary_token_budget"],
+            temperature=0.3
+        )
+        summary = response.choices[0].message.content.strip()
+    except LLMOverloaded:
+        # Сообщения останутся за summarized_until и свернутся при следующем ходе диалога
+        console.log(f"[yellow]Summary update deferred for bot #{bot['id']}, chat {chat_id}: LLM queue is full")
+        return
+    except Exception as e:
+        console.log(f"[red]Summary update failed for bot #{bot['id']}, chat {chat_id}: {e}")
+        return
+    if response.usage:
+        await record_usage(conn, bot["id"], "summary", is_test, usage_counts(response.usage, started))
+
+    await conn.execute(
+        """
+        INSERT INTO chat_summaries (bot_id, chat_id, summary, summarized_until, updated_at)
+        VALUES ($1, $2, $3, $4, NOW())
+        ON CONFLICT (bot_id, chat_id) DO UPDATE
+        SET summary = $3, summarized_until = $4, updated_at = NOW()
+        """,
+        bot["id"], chat_id, summary, rows[-1]["timestamp"]
+    )
+
+async def clear_history(conn, bot_id: int, chat_id: str = None):
+    if chat_id is None:
+        await conn.execute("DELETE FROM chat_summaries WHERE bot_id = $1", bot_id)
+    else:
+        await conn.execute("DELETE FROM chat_summaries WHERE bot_id = $1 AND chat_id = $2", bot_id, chat_id)
@@ -0,0 +1,66 @@
+import datetime as dt
+from ..utils import encode_cursor
+
+EXPORT_COLUMNS = ["id", "timestamp", "chat_id", "ad_id", "text", "response", "status", "delivery_status", "is_test"]
+
+def _filters(
+    bot_id: int, chat_id: str = None, is_test: bool = None, status: str = None,
+    date_from: dt.date = None, date_to: dt.date = None
+) -> tuple:
+    conditions = ["bot_id = $1"]
+    args = [bot_id]
+    if chat_id is not None:
+        args.append(chat_id)
+        conditions.append(f"chat_id = ${len(args)}")
+    if is_test is not None:
+        args.append(is_test)
+        conditions.append(f"is_test = ${len(args)}")
+    if status is not None:
+        args.append(status)
+        conditions.append(f"status = ${len(args)}")
+    if date_from is not None:
+        args.append(dt.datetime.combine(date_from, dt.time()))
+        conditions.append(f"timestamp >= ${len(args)}")
+    if date_to is not None:
+        # date_to включительно
+        args.append(dt.datetime.combine(date_to + dt.timedelta(days=1), dt.time()))
+        conditions.append(f"timestamp < ${len(args)}")
+    return conditions, args
+
+# Постраничная выборка сообщений по ключу (timestamp, id) — без OFFSET,
+# стоимость страницы не зависит от размера истории бота
+async def fetch_messages_page(conn, bot_id: int, before: tuple = None, limit: int = 50, **filters) -> dict:
+    conditions, args = _filters(bot_id, **filters)
+    if before is not None:
+        args.extend(before)
+        conditions.append(f"(timestamp, id) < (${len(args) - 1}, ${len(args)})")
+    args.append(limit + 1)
+
+    rows = await conn.fetch(
+        f"""
+        SELECT * FROM messages
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ${len(args)}
+        """,
+        *args
+    )
+    messages = rows[:limit]
+    next_cursor = encode_cursor(messages[-1]["timestamp"], messages[-1]["id"]) if len(rows) > limit else None
+    return {"messages": messages, "next_cursor": next_cursor}
+
+async def iter_messages(conn, bot_id: int, prefetch: int = 500, **filters):
+    # Серверный курсор: в памяти одновременно не больше prefetch строк, сколько бы их ни было.
+    # Курсоры asyncpg работают только внутри транзакции
+    conditions, args = _filters(bot_id, **filters)
+    async with conn.transaction(readonly=True):
+        async for row in conn.cursor(
+            f"""
+            SELECT {", ".join(EXPORT_COLUMNS)} FROM messages
+            WHERE {" AND ".join(conditions)}
+            ORDER BY timestamp DESC, id DESC
+            """,
+            *args,
+            prefetch=prefetch
+        ):
+            yield row
@@ -0,0 +1,75 @@
+import hashlib
+import json
+from collections import OrderedDict
+from ..config import SERVICE_CONFIG
+from .response_cache import invalidate_responses
+
+PROMPT_CACHE_SIZE = SERVICE_CONFIG.get("prompt_cache_size", 1000)
+
+# bot_id -> скомпилированная конфигурация бота (LRU)
+_cache = OrderedDict()
+
+def _load_specs(value) -> list:
+    if not value:
+        return []
+    return json.loads(value) if isinstance(value, str) else value
+
+# Общая для всех ботов часть системного промпта. Идет первым сообщением и не меняется
+# ни между ходами, ни между ботами: этот префикс попадает в кэш контекста DeepSeek
+REPLY_FORMAT_PROMPT = """Отвечай в формате JSON, который будет иметь такую структуру:
+{
+  "response": "string(твой ответ пользователю)",
+  "actions": [{"action": "string(название действия из списка твоих действий)", "value": "string(параметры действия)"}, {"action": "string()", "value": "string()"}],
+  "parameters": [{"parameter": "string()", "value": "string()"}, {"parameter": "string(название параметра из списка параметров)", "value": "string(значение параметра)"}]
+}
+В каждом ответе обновляй/дополняй параметры. Действия совершай, если это уместно на данном этапе диалога."""
+
+def enhance_prompt(prompt: str, parameters: list, actions: list) -> str:
+    # Часть промпта конкретного бота: меняется только вместе с версией бота
+    parameters_text = "\n".join(f"[{p['name']}] [{p['description']}]" for p in parameters) if parameters else ""
+    actions_text = "\n".join(f"[{a['name']}] [{a['description']}]" for a in actions) if actions else ""
+    
+    return f"""{prompt}
+
+В процессе диалога ты должен собрать следующие данные (список параметров):
+{parameters_text}
+
+В процессе диалога ты должен совершать действия для каждого твоего ответа, если это уместно на данном этапе диалога:
+{actions_text}"""
+
+def compile_bot(bot) -> dict:
+    parameters = _load_specs(bot["parameters"])
+    actions = _load_specs(bot["actions"])
+    prompt = enhance_prompt(bot["prompt"], parameters, actions)
+    return {
+        "version": bot["version"],
+        "parameters": parameters,
+        "actions": actions,
+        "prompt": prompt,
+        "prompt_hash": hashlib.sha256(prompt.encode()).hexdigest(),
+    }
+
+def get_compiled_bot(bot) -> dict:
+    # Запись в кэше актуальна, пока совпадает версия бота (bots.version растет при каждом обновлении)
+    compiled = _cache.get(bot["id"])
+    if compiled is None or compiled["version"] != bot["version"]:
+        compiled = compile_bot(bot)
+        _cache[bot["id"]] = compiled
+        if len(_cache) > PROMPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    _cache.move_to_end(bot["id"])
+    return compiled
+
+def invalidate_bot(bot_id: int = None):
+    if bot_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(bot_id, None)
+    invalidate_responses(bot_id)
+
+async def notify_bot_changed(conn, bot_id: int):
+    # Остальные процессы сбрасывают кэш по LISTEN bot_config (см. app/events.py)
+    await conn.execute("SELECT pg_notify('bot_config', $1)", str(bot_id))
+
+def on_bot_config_notify(payload: str):
+    invalidate_bot(int(payload) if payload else None)
@@ -0,0 +1,118 @@
+import re
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from ..config import SERVICE_CONFIG
+from ..metrics import incr
+
+RESPONSE_CACHE_TTL = SERVICE_CONFIG.get("response_cache_ttl", 24 * 3600)
+# Записей на одного бота и ботов в кэше процесса
+RESPONSE_CACHE_SIZE = SERVICE_CONFIG.get("response_cache_size", 500)
+RESPONSE_CACHE_BOTS = SERVICE_CONFIG.get("response_cache_bots", 1000)
+# Порог косинусной близости триграммных векторов для похожих вопросов. По умолчанию 1.0 —
+# только точное совпадение нормализованного текста; нечеткий уровень включается явно, порогом около 0.97.
+# Это сходство написания, а не смысла: перефразировку другими словами оно не находит
+RESPONSE_CACHE_TRIGRAM_SIMILARITY = SERVICE_CONFIG.get("response_cache_trigram_similarity", 1.0)
+TRIGRAM_DIM = 512
+# Слова, меняющие смысл вопроса на противоположный
+NEGATIONS = {"не", "нет", "ни", "без"}
+
+# bot_id -> {"prompt_hash", "entries": OrderedDict(нормализованный текст -> запись)} (LRU по ботам и по записям)
+_cache = OrderedDict()
+
+def normalize_message(text: str) -> str:
+    text = (text or "").lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", text))
+
+def guard_tokens(normalized: str) -> frozenset:
+    # Числа и отрицания: «за 3000?» и «за 4000?», «размер 42» и «размер 44», «актуален» и «не актуален»
+    # по триграммам почти одинаковы, а ответы на них разные. Такие вопросы совпадают только точно
+    return frozenset(
+        token for token in normalized.split() if token in NEGATIONS or any(char.isdigit() for char in token)
+    )
+
+def trigram_vector(normalized: str) -> np.ndarray:
+    # Хэшированные символьные триграммы: дешевый вектор на CPU без внешней модели,
+    # близкий для вопросов с почти тем же написанием вроде «актуально?» / «еще актуально»
+    vector = np.zeros(TRIGRAM_DIM, dtype=np.float32)
+    padded = f" {normalized} "
+    for i in range(len(padded) - 2):
+        vector[zlib.crc32(padded[i:i + 3].encode()) % TRIGRAM_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _bot_cache(bot_id: int, prompt_hash: str) -> dict:
+    # Запись бота со старым хэшем промпта уже не годится: промпт изменился
+    cache = _cache.get(bot_id)
+    if cache is None or cache["prompt_hash"] != prompt_hash:
+        cache = _cache[bot_id] = {"prompt_hash": prompt_hash, "entries": OrderedDict(), "matrix": None}
+    _cache.move_to_end(bot_id)
+    if len(_cache) > RESPONSE_CACHE_BOTS:
+        _cache.popitem(last=False)
+    return cache
+
+def _matrix(cache: dict):
+    if cache["matrix"] is None:
+        entries = list(cache["entries"].items())
+        cache["matrix"] = (
+            [key for key, _ in entries],
+            np.stack([entry["vector"] for _, entry in entries]) if entries else None,
+        )
+    return cache["matrix"]
+
+def _drop(cache: dict, key: str):
+    cache["entries"].pop(key, None)
+    cache["matrix"] = None
+
+def lookup(bot_id: int, prompt_hash: str, message: str):
+    cache = _bot_cache(bot_id, prompt_hash)
+    key = normalize_message(message)
+    now = time.monotonic()
+
+    entry = cache["entries"].get(key)
+    if entry is not None and entry["expires_at"] > now:
+        cache["entries"].move_to_end(key)
+        incr("response_cache.hits_exact")
+        return entry["response"]
+    if entry is not None:
+        _drop(cache, key)
+
+    keys, matrix = _matrix(cache)
+    if matrix is not None and RESPONSE_CACHE_TRIGRAM_SIMILARITY < 1.0:
+        guard = guard_tokens(key)
+        scores = matrix @ trigram_vector(key)
+        scores[[cache["entries"][candidate]["guard"] != guard for candidate in keys]] = -1.0
+        best = int(np.argmax(scores))
+        entry = cache["entries"][keys[best]]
+        if scores[best] >= RESPONSE_CACHE_TRIGRAM_SIMILARITY and entry["expires_at"] > now:
+            cache["entries"].move_to_end(keys[best])
+            incr("response_cache.hits_trigram")
+            return entry["response"]
+
+    incr("response_cache.misses")
+    return None
+
+def store(bot_id: int, prompt_hash: str, message: str, response: dict):
+    cache = _bot_cache(bot_id, prompt_hash)
+    key = normalize_message(message)
+    if not key:
+        return
+    cache["entries"][key] = {
+        "response": response,
+        "vector": trigram_vector(key),
+        "guard": guard_tokens(key),
+        "expires_at": time.monotonic() + RESPONSE_CACHE_TTL,
+    }
+    cache["entries"].move_to_end(key)
+    if len(cache["entries"]) > RESPONSE_CACHE_SIZE:
+        cache["entries"].popitem(last=False)
+        incr("response_cache.evictions")
+    cache["matrix"] = None
+    incr("response_cache.stores")
+
+def invalidate_responses(bot_id: int = None):
+    if bot_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(bot_id, None)
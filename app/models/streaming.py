@@ -0,0 +1,236 @@
+import json
+
+class MalformedReply(ValueError):
+    pass
+
+# Поля ответа модели верхнего уровня и типы их значений
+REPLY_SCHEMA = {"response": str, "actions": list, "parameters": list}
+
+# Инкрементальный разбор JSON-ответа модели, пока он еще генерируется.
+# feed() принимает очередной кусок текста и возвращает новую раскодированную часть поля
+# "response"; pop_fields() отдает поля верхнего уровня, значения которых уже закрыты
+# (например, "actions" — можно выполнять действия, не дожидаясь конца ответа).
+# Нарушение синтаксиса или схемы сразу дает MalformedReply — генерацию можно прерывать.
+class ReplyParser:
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    LITERALS = {"true": True, "false": False, "null": None}
+    NUMBER_CHARS = set("+-0123456789.eE")
+
+    def __init__(self, schema: dict = REPLY_SCHEMA, text_field: str = "response"):
+        self.schema = schema
+        self.text_field = text_field
+        self.root = None
+        self.done = False
+        self._stack = []
+        self._keys = []
+        self._state = "value"
+        self._token = []
+        self._string_is_key = False
+        self._escape = None
+        self._high_surrogate = None
+        self._fields = []
+        self._text = []
+
+    def pop_fields(self) -> list:
+        fields, self._fields = self._fields, []
+        return fields
+
+    def result(self) -> dict:
+        if self._state == "number":
+            self._finish_number()
+        if not self.done:
+            raise MalformedReply("Ответ оборвался до конца JSON")
+        if self.schema:
+            missing = [field for field in self.schema if field not in self.root]
+            if missing:
+                raise MalformedReply(f"Нет полей: {', '.join(missing)}")
+        return self.root
+
+    def feed(self, chunk: str) -> str:
+        for char in chunk:
+            self._step(char)
+        text, self._text = "".join(self._text), []
+        return text
+
+    def _fail(self, reason: str):
+        raise MalformedReply(reason)
+
+    def _step(self, char: str):
+        state = self._state
+        if state == "string":
+            self._string_char(char)
+            return
+        if state == "number":
+            if char in self.NUMBER_CHARS:
+                self._token.append(char)
+                return
+            self._finish_number()
+            state = self._state
+        if state == "literal":
+            self._token.append(char)
+            word = "".join(self._token)
+            if word in self.LITERALS:
+                self._add_value(self.LITERALS[word])
+            elif not any(literal.startswith(word) for literal in self.LITERALS):
+                self._fail(f"Неожиданный литерал {word!r}")
+            return
+        if char in " \t\r\n":
+            return
+
+        if state == "end":
+            self._fail("Лишние символы после JSON")
+        elif state == "key" or state == "key_or_end":
+            if char == '"':
+                self._start_string(is_key=True)
+            elif char == "}" and state == "key_or_end":
+                self._close("}")
+            else:
+                self._fail("Ожидался ключ объекта")
+        elif state == "colon":
+            if char != ":":
+                self._fail("Ожидалось ':'")
+            self._state = "value"
+        elif state == "comma_or_end":
+            if char == ",":
+                self._state = "key" if isinstance(self._stack[-1], dict) else "value"
+            elif char in "}]":
+                self._close(char)
+            else:
+                self._fail("Ожидалось ',' или конец контейнера")
+        elif state in ("value", "value_or_end"):
+            if char == "]" and state == "value_or_end":
+                self._close("]")
+            else:
+                self._start_value(char)
+
+    def _check_value_start(self, kind: type):
+        depth = len(self._stack)
+        if depth == 0:
+            if kind is not dict:
+                self._fail("Ответ должен быть JSON-объектом")
+            return
+        if not self.schema:
+            return
+        field = self._keys[0]
+        expected = self.schema.get(field)
+        if depth == 1 and expected is not None and kind is not expected:
+            self._fail(f"Поле {field} должно быть {expected.__name__}")
+        if depth == 2 and expected is list and kind is not dict:
+            self._fail(f"Элементы {field} должны быть объектами")
+
+    def _start_value(self, char: str):
+        if char == "{":
+            self._check_value_start(dict)
+            self._open({})
+        elif char == "[":
+            self._check_value_start(list)
+            self._open([])
+        elif char == '"':
+            self._check_value_start(str)
+            self._start_string(is_key=False)
+        elif char in "-0123456789":
+            self._check_value_start(float)
+            self._token = [char]
+            self._state = "number"
+        elif char in "tfn":
+            self._check_value_start(bool)
+            self._token = [char]
+            self._state = "literal"
+        else:
+            self._fail(f"Неожиданный символ {char!r}")
+
+    def _open(self, container):
+        if self._stack:
+            self._attach(container)
+        else:
+            self.root = container
+        self._stack.append(container)
+        # Ключ текущего поля на каждом уровне вложенности (для массивов — None)
+        self._keys.append(None)
+        self._state = "key_or_end" if isinstance(container, dict) else "value_or_end"
+
+    def _attach(self, value):
+        parent = self._stack[-1]
+        if isinstance(parent, dict):
+            parent[self._keys[-1]] = value
+        else:
+            parent.append(value)
+
+    def _close(self, char: str):
+        container = self._stack.pop()
+        self._keys.pop()
+        if (char == "}") != isinstance(container, dict):
+            self._fail("Несогласованные скобки")
+        self._after_value(container)
+
+    def _add_value(self, value):
+        self._attach(value)
+        self._after_value(value)
+
+    def _after_value(self, value):
+        depth = len(self._stack)
+        if depth == 0:
+            self.done = True
+            self._state = "end"
+            return
+        if depth == 1:
+            self._fields.append((self._keys[0], value))
+        self._state = "comma_or_end"
+
+    def _finish_number(self):
+        token = "".join(self._token)
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            self._fail(f"Неверное число {token!r}")
+        self._state = "value"
+        self._add_value(value)
+
+    def _start_string(self, is_key: bool):
+        self._string_is_key = is_key
+        self._token = []
+        self._state = "string"
+
+    def _emit(self, text: str):
+        self._token.append(text)
+        if not self._string_is_key and len(self._stack) == 1 and self._keys[0] == self.text_field:
+            self._text.append(text)
+
+    def _string_char(self, char: str):
+        if self._escape is not None:
+            if self._escape == "" and char != "u":
+                if char not in self.ESCAPES:
+                    self._fail(f"Неверная escape-последовательность \\{char}")
+                self._emit(self.ESCAPES[char])
+                self._escape = None
+                return
+            self._escape += char
+            if len(self._escape) == 5:
+                try:
+                    code = int(self._escape[1:], 16)
+                except ValueError:
+                    self._fail(f"Неверная escape-последовательность \\{self._escape}")
+                self._escape = None
+                self._unicode(code)
+            return
+        if char == "\\":
+            self._escape = ""
+        elif char == '"':
+            value = "".join(self._token)
+            if self._string_is_key:
+                self._keys[-1] = value
+                self._state = "colon"
+            else:
+                self._state = "value"
+                self._add_value(value)
+        else:
+            self._emit(char)
+
+    def _unicode(self, code: int):
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+            return
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        self._emit(chr(code))
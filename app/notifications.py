@@ -0,0 +1,143 @@
+import asyncio
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from rich.console import Console
+from .config import SERVICE_CONFIG
+from .metrics import incr
+from .queries import fetch
+from .ratelimit import TokenBucket
+
+console = Console()
+
+NOTIFICATIONS_BATCH_SIZE = SERVICE_CONFIG.get("notifications_batch_size", 200)
+NOTIFICATIONS_LEASE_SECONDS = SERVICE_CONFIG.get("notifications_lease_seconds", 120)
+NOTIFICATIONS_MAX_ATTEMPTS = SERVICE_CONFIG.get("notifications_max_attempts", 8)
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+TELEGRAM_GLOBAL_RATE = SERVICE_CONFIG.get("telegram_global_rate", 25)
+TELEGRAM_CHAT_RATE = SERVICE_CONFIG.get("telegram_chat_rate", 1)
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Категории, уведомления которых склеиваются в дайджест, и окно накопления в секундах.
+# Уведомления прочих категорий отправляются по одному
+NOTIFICATION_DIGEST = SERVICE_CONFIG.get("notification_digest", {"action": 60, "test": 30, "billing": 0})
+DIGEST_TITLES = {
+    "action": "Уведомления от ботов",
+    "test": "Тестовый режим",
+    "billing": "Баланс",
+}
+
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+_chat_buckets = {}
+
+def _chat_bucket(telegram_id: str) -> TokenBucket:
+    bucket = _chat_buckets.get(telegram_id)
+    if bucket is None:
+        bucket = _chat_buckets[telegram_id] = TokenBucket(TELEGRAM_CHAT_RATE, 1)
+    return bucket
+
+def _digest_windows() -> tuple:
+    return list(NOTIFICATION_DIGEST), [float(seconds) for seconds in NOTIFICATION_DIGEST.values()]
+
+async def claim_batch(conn, limit: int) -> list:
+    return await fetch(conn, "claim_notifications", limit, NOTIFICATIONS_LEASE_SECONDS, *_digest_windows())
+
+async def seconds_until_due(conn):
+    # Через сколько секунд станет готово ближайшее отложенное уведомление (окно дайджеста или повтор)
+    return await conn.fetchval(
+        """
+        SELECT GREATEST(0, EXTRACT(EPOCH FROM MIN(
+            GREATEST(n.available_at, n.created_at + make_interval(secs => COALESCE(w.window_seconds, 0)))
+        ) - NOW()))
+        FROM notifications n
+        LEFT JOIN unnest($1::text[], $2::float8[]) AS w(category, window_seconds) ON w.category = n.category
+        WHERE n.status IN ('pending', 'sending')
+        """,
+        *_digest_windows()
+    )
+
+def digest_text(category: str, texts: list) -> str:
+    # Одинаковые тексты схлопываются в одну строку со счетчиком
+    counts = {}
+    for text in texts:
+        counts[text] = counts.get(text, 0) + 1
+    if len(counts) == 1:
+        return texts[0]
+
+    title = DIGEST_TITLES.get(category, "Уведомления")
+    result = f"{title} ({len(texts)}):"
+    for index, (text, count) in enumerate(counts.items()):
+        line = f"\n• {text}" + (f" (×{count})" if count > 1 else "")
+        rest = f"\n… и еще {len(counts) - index}"
+        if len(result) + len(line) + len(rest) > TELEGRAM_MESSAGE_LIMIT:
+            return result + rest
+        result += line
+    return result
+
+def _group(notifications: list) -> list:
+    groups = {}
+    for notification in notifications:
+        key = notification["id"] if notification["category"] not in NOTIFICATION_DIGEST else notification["category"]
+        groups.setdefault(key, []).append(notification)
+    return list(groups.values())
+
+async def _send_chat(telegram, telegram_id: str, notifications: list, results: list):
+    # Уведомления одного чата уходят по порядку, разные чаты — параллельно
+    for group in _group(notifications):
+        ids = [notification["id"] for notification in group]
+        attempts = max(notification["attempts"] for notification in group)
+        text = digest_text(group[0]["category"], [notification["text"] for notification in group])
+        try:
+            await _chat_bucket(telegram_id).acquire()
+            await _global_bucket.acquire()
+            await telegram.send_message(telegram_id, text)
+            results.extend((notification_id, "sent", 0.0, None) for notification_id in ids)
+            incr("notifications.sent")
+            incr("notifications.coalesced", len(ids) - 1)
+        except TelegramRetryAfter as e:
+            results.extend((notification_id, "pending", float(e.retry_after), str(e)) for notification_id in ids)
+        except TelegramForbiddenError as e:
+            # Пользователь заблокировал бота — повторять бессмысленно
+            results.extend((notification_id, "failed", 0.0, str(e)) for notification_id in ids)
+        except Exception as e:
+            console.log(f"[red]Error sending notification to {telegram_id}: {e}")
+            if attempts >= NOTIFICATIONS_MAX_ATTEMPTS:
+                results.extend((notification_id, "failed", 0.0, str(e)) for notification_id in ids)
+            else:
+                results.extend((notification_id, "pending", float(2 ** attempts), str(e)) for notification_id in ids)
+            incr("notifications.errors")
+
+async def write_results(conn, results: list):
+    if not results:
+        return
+    ids, statuses, delays, errors = zip(*results)
+    await conn.execute(
+        """
+        UPDATE notifications n
+        SET status = r.status,
+            sent_at = CASE WHEN r.status = 'pending' THEN n.sent_at ELSE NOW() END,
+            available_at = NOW() + make_interval(secs => r.delay),
+            last_error = r.error
+        FROM unnest($1::bigint[], $2::text[], $3::float8[], $4::text[]) AS r(id, status, delay, error)
+        WHERE n.id = r.id
+        """,
+        list(ids), list(statuses), list(delays), list(errors)
+    )
+
+async def dispatch_notifications(pool, telegram):
+    # Возвращает, через сколько секунд запустить рассылку снова, если есть отложенные уведомления
+    while True:
+        async with pool.acquire() as conn:
+            notifications = await claim_batch(conn, NOTIFICATIONS_BATCH_SIZE)
+            if not notifications:
+                due = await seconds_until_due(conn)
+                return float(due) if due is not None else None
+
+        by_chat = {}
+        for notification in notifications:
+            by_chat.setdefault(notification["telegram_id"], []).append(notification)
+        results = []
+        await asyncio.gather(*(
+            _send_chat(telegram, telegram_id, chat, results) for telegram_id, chat in by_chat.items()
+        ))
+
+        async with pool.acquire() as conn:
+            await write_results(conn, results)
+        console.log(f"[green]Dispatched {len(notifications)} notifications to {len(by_chat)} chats")
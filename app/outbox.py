@@ -0,0 +1,120 @@
+import json
+import time
+from .config import AVITO_API_URL, SERVICE_CONFIG
+from .lease_queue import LeaseQueue
+from .metrics import incr, observe
+from .queries import fetch
+from .ratelimit import TokenBucket
+from .models.avito_client import avito_request
+from .models.avito_tokens import get_valid_token
+
+OUTBOX_CONCURRENCY = SERVICE_CONFIG.get("outbox_concurrency", 8)
+OUTBOX_BATCH_SIZE = SERVICE_CONFIG.get("outbox_batch_size", 32)
+OUTBOX_POLL_INTERVAL = SERVICE_CONFIG.get("outbox_poll_interval", 1.0)
+OUTBOX_LEASE_SECONDS = SERVICE_CONFIG.get("outbox_lease_seconds", 120)
+OUTBOX_MAX_ATTEMPTS = SERVICE_CONFIG.get("outbox_max_attempts", 5)
+# Лимит отправки на один аккаунт Avito: сообщений в секунду и размер всплеска
+OUTBOX_RATE_PER_ACCOUNT = SERVICE_CONFIG.get("outbox_rate_per_account", 1.0)
+OUTBOX_BURST_PER_ACCOUNT = SERVICE_CONFIG.get("outbox_burst_per_account", 3)
+
+_buckets = {}
+
+def _bucket(account_id: int) -> TokenBucket:
+    bucket = _buckets.get(account_id)
+    if bucket is None:
+        bucket = _buckets[account_id] = TokenBucket(OUTBOX_RATE_PER_ACCOUNT, OUTBOX_BURST_PER_ACCOUNT)
+    return bucket
+
+def reply_text(raw_response) -> str:
+    try:
+        response = json.loads(raw_response) if isinstance(raw_response, str) else raw_response
+        return response.get("response") or ""
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return ""
+
+async def claim_batch(conn, limit: int) -> list:
+    return await fetch(conn, "claim_outbox", limit, OUTBOX_LEASE_SECONDS)
+
+async def mark_sent(conn, message_id: int, avito_message_id: str):
+    await conn.execute(
+        """
+        UPDATE messages
+        SET delivery_status = 'sent', delivered_at = NOW(), avito_message_id = $2, delivery_error = NULL
+        WHERE id = $1
+        """,
+        message_id, avito_message_id
+    )
+
+async def mark_failed(conn, message_id: int, attempts: int, error: str):
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        await conn.execute(
+            "UPDATE messages SET delivery_status = 'failed', delivery_error = $2 WHERE id = $1",
+            message_id, error
+        )
+        return
+    await conn.execute(
+        """
+        UPDATE messages
+        SET delivery_status = 'pending', delivery_error = $2,
+            delivery_available_at = NOW() + make_interval(secs => $3)
+        WHERE id = $1
+        """,
+        message_id, error, 2 ** attempts
+    )
+
+async def _find_sent_message(account_id: int, chat_id: str, text: str, access_token: str):
+    # Исход прошлой попытки неизвестен: ищем ответ среди последних исходящих сообщений чата,
+    # чтобы не отправить его дважды
+    response = await avito_request(
+        "GET",
+        f"{AVITO_API_URL}/messenger/v3/accounts/{account_id}/chats/{chat_id}/messages/",
+        params={"limit": 20},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    if response.status_code != 200:
+        return None
+    for message in response.json().get("messages", []):
+        if message.get("direction") == "out" and (message.get("content") or {}).get("text") == text:
+            return str(message.get("id"))
+    return None
+
+async def deliver(conn, row):
+    text = reply_text(row["response"])
+    if not text or not row["chat_id"] or not row["account_id"]:
+        await conn.execute("UPDATE messages SET delivery_status = NULL WHERE id = $1", row["id"])
+        return
+
+    access_token = await get_valid_token(row["bot_id"], conn)
+    if row["previous_status"] == "sending":
+        sent_id = await _find_sent_message(row["account_id"], row["chat_id"], text, access_token)
+        if sent_id:
+            await mark_sent(conn, row["id"], sent_id)
+            incr("outbox.deduplicated")
+            return
+
+    await _bucket(row["account_id"]).acquire()
+    started = time.perf_counter()
+    response = await avito_request(
+        "POST",
+        f"{AVITO_API_URL}/messenger/v1/accounts/{row['account_id']}/chats/{row['chat_id']}/messages",
+        json={"message": {"text": text}, "type": "text"},
+        headers={"Authorization": f"Bearer {access_token}", "X-Idempotency-Key": str(row["delivery_key"])}
+    )
+    observe("outbox.send_seconds", time.perf_counter() - started)
+    if response.status_code not in (200, 201):
+        raise RuntimeError(f"Avito API {response.status_code}: {response.text}")
+
+    await mark_sent(conn, row["id"], str(response.json().get("id", "")))
+    incr("outbox.sent")
+
+async def _mark_row_failed(conn, row, error: str):
+    incr("outbox.errors")
+    await mark_failed(conn, row["id"], row["delivery_attempts"], error)
+
+async def run_outbox_workers(pool, concurrency: int = OUTBOX_CONCURRENCY):
+    # Статус отправки записывает сам deliver, отдельный mark_done не нужен
+    queue = LeaseQueue(
+        "Outbox", claim=claim_batch, handle=deliver, mark_failed=_mark_row_failed,
+        concurrency=concurrency, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL
+    )
+    await queue.run(pool)
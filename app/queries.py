@@ -0,0 +1,125 @@
+import json
+import asyncpg
+from rich.console import Console
+
+console = Console()
+
+# Именованные запросы горячих путей. Каждое соединение пула подготавливает их один раз
+# при создании (init-хук пула), дальше выполнение идет без повторного разбора и планирования
+QUERIES = {
+    # Бот вместе со статусом токена Avito и данными владельца (страницы ботов)
+    "owned_bot": """
+        SELECT b.id, b.user_id, b.prompt, b.parameters, b.actions, b.status, b.items, b.is_authorized,
+               b.history_turns, b.history_token_budget, b.summary_token_budget, b.version, b.response_cache,
+               t.bot_id IS NOT NULL AS has_token, t.account_id, t.expires_at AS token_expires_at,
+               u.telegram_id AS owner_telegram_id, u.balance AS owner_balance, u.trial_end_date AS owner_trial_end_date
+        FROM bots b
+        JOIN users u ON u.id = b.user_id
+        LEFT JOIN tokens t ON t.bot_id = b.id
+        WHERE b.id = $1 AND b.user_id = $2
+    """,
+    "user_by_id": """
+        SELECT * FROM users WHERE id = $1
+    """,
+    # Повторная доставка того же сообщения от Avito игнорируется
+    "insert_inbox": """
+        INSERT INTO webhook_inbox (account_id, message_id, payload)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (account_id, message_id) DO NOTHING
+    """,
+    # Строки в статусе processing с истекшей арендой забираются повторно (воркер упал)
+    "claim_inbox": """
+        UPDATE webhook_inbox
+        SET status = 'processing', attempts = attempts + 1,
+            available_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT id FROM webhook_inbox
+            WHERE status IN ('pending', 'processing') AND available_at <= NOW()
+            ORDER BY available_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, account_id, payload, attempts
+    """,
+    # Строки 'sending' с истекшей арендой — попытка, исход которой неизвестен (воркер упал)
+    "claim_outbox": """
+        UPDATE messages m
+        SET delivery_status = 'sending', delivery_attempts = m.delivery_attempts + 1,
+            delivery_available_at = NOW() + make_interval(secs => $2)
+        FROM (
+            SELECT id, delivery_status AS previous_status FROM messages
+            WHERE delivery_status IN ('pending', 'sending') AND delivery_available_at <= NOW()
+            ORDER BY delivery_available_at
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ) claimed
+        WHERE m.id = claimed.id
+        RETURNING m.id, m.bot_id, m.account_id, m.chat_id, m.response, m.delivery_key,
+                  m.delivery_attempts, claimed.previous_status
+    """,
+    # Группа (telegram_id, категория) с дайджестом забирается целиком, когда самое старое
+    # ее уведомление пролежало окно накопления. 'sending' с истекшей арендой — уведомления
+    # упавшего процесса рассылки
+    "claim_notifications": """
+        WITH windows AS (
+            SELECT * FROM unnest($3::text[], $4::float8[]) AS w(category, window_seconds)
+        ),
+        due AS (
+            SELECT DISTINCT n.telegram_id, n.category
+            FROM notifications n
+            JOIN windows w ON w.category = n.category
+            WHERE n.status IN ('pending', 'sending') AND n.available_at <= NOW()
+              AND n.created_at <= NOW() - make_interval(secs => w.window_seconds)
+        )
+        UPDATE notifications
+        SET status = 'sending', attempts = attempts + 1,
+            available_at = NOW() + make_interval(secs => $2)
+        WHERE id IN (
+            SELECT n.id FROM notifications n
+            LEFT JOIN windows w ON w.category = n.category
+            WHERE n.status IN ('pending', 'sending') AND n.available_at <= NOW()
+              AND (w.category IS NULL OR (n.telegram_id, n.category) IN (SELECT telegram_id, category FROM due))
+            ORDER BY n.id
+            LIMIT $1
+            FOR UPDATE OF n SKIP LOCKED
+        )
+        RETURNING id, telegram_id, category, text, attempts
+    """,
+}
+
+# Соединение пула с подготовленными запросами
+class AppConnection(asyncpg.Connection):
+    __slots__ = ("statements",)
+
+def _encode_json(value):
+    # Строки считаем уже сериализованным JSON: так старые вызовы с json.dumps продолжают работать
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+async def init_connection(conn):
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(type_name, encoder=_encode_json, decoder=json.loads, schema="pg_catalog")
+    conn.statements = {}
+    for name, sql in QUERIES.items():
+        try:
+            conn.statements[name] = await conn.prepare(sql)
+        except asyncpg.PostgresError as e:
+            # Например, миграция еще не применена: запрос подготовится при первом использовании
+            console.log(f"[yellow]Не удалось подготовить запрос {name}: {e}")
+
+async def statement(conn, name: str):
+    statements = getattr(conn, "statements", None)
+    if statements is None:
+        # Отдельное соединение вне пула
+        return await conn.prepare(QUERIES[name])
+    if name not in statements:
+        statements[name] = await conn.prepare(QUERIES[name])
+    return statements[name]
+
+async def fetch(conn, name: str, *args) -> list:
+    return await (await statement(conn, name)).fetch(*args)
+
+async def fetchrow(conn, name: str, *args):
+    return await (await statement(conn, name)).fetchrow(*args)
+
+async def executemany(conn, name: str, args: list):
+    await (await statement(conn, name)).executemany(args)
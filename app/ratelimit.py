@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Скользящее окно неудачных попыток по ключу (пара логин/IP, IP и т.п.).
+# Состояние хранится в памяти процесса и между процессами не делится
+class AttemptLimiter:
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = {}
+
+    def _recent(self, key, now: float) -> list:
+        attempts = [moment for moment in self._attempts.get(key, ()) if moment > now - self.window]
+        if attempts:
+            self._attempts[key] = attempts
+        else:
+            self._attempts.pop(key, None)
+        return attempts
+
+    def blocked(self, key) -> bool:
+        return len(self._recent(key, time.monotonic())) >= self.limit
+
+    def record(self, key):
+        now = time.monotonic()
+        if key not in self._attempts and len(self._attempts) >= self.max_keys:
+            for stale in [k for k, attempts in self._attempts.items() if attempts[-1] <= now - self.window]:
+                del self._attempts[stale]
+        attempts = self._recent(key, now)
+        attempts.append(now)
+        self._attempts[key] = attempts
+
+    def reset(self, key):
+        self._attempts.pop(key, None)
@@ -2,8 +2,9 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
+from ..models.bots import get_owned_bot
 from ..config import SERVICE_CONFIG
 from ..utils import send_notification
 from rich.console import Console
@@ -14,14 +15,12 @@ console = Console()
 
 @router.post("/{bot_id}/activate", response_class=RedirectResponse)
 async def activate_bot(
-    bot_id: int, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)
+    bot_id: int,
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
+    conn=Depends(get_db_connection)
 ):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Бот #{bot_id} не найден для пользователя #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
-        
         if not bot["is_authorized"]:
             await send_notification(user["telegram_id"], f"Бот #{bot_id} не может быть активирован: привяжите аккаунт Avito.", conn)
             raise HTTPException(status_code=400, detail="Привяжите аккаунт Avito")
@@ -30,8 +29,8 @@ async def activate_bot(
             await send_notification(user["telegram_id"], f"Бот #{bot_id} не может быть активирован: выберите объявления.", conn)
             raise HTTPException(status_code=400, detail="Выберите объявления")
         
-        trial_active = user["trial_end_date"] > dt.datetime.utcnow()
-        if not trial_active and user["balance"] < SERVICE_CONFIG["bot_daily_cost"]:
+        trial_active = bot["owner_trial_end_date"] > dt.datetime.utcnow()
+        if not trial_active and bot["owner_balance"] < SERVICE_CONFIG["bot_daily_cost"]:
             await send_notification(user["telegram_id"], f"Недостаточно средств для активации бота #{bot_id}. Пополните баланс.", conn)
             raise HTTPException(status_code=400, detail="Недостаточно средств")
         
@@ -3,14 +3,14 @@
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import HTMLResponse
 from ..templates_config import templates
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from rich.console import Console
 
 router = APIRouter()
 console = Console()
 
 @router.get("/order-prompt", response_class=HTMLResponse)
-async def order_prompt_page(request: Request, user: dict = Depends(get_current_user_from_token)):
+async def order_prompt_page(request: Request, user: dict = Depends(get_current_user_claims)):
     try:
         console.log(f"[green]Отображение страницы order_prompt для пользователя #{user['id']}")
         return templates.TemplateResponse("order_prompt.html", {"request": request, "user": user})
@@ -2,8 +2,9 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
+from ..models.bots import get_owned_bot
 from ..utils import send_notification
 from rich.console import Console
 
@@ -12,13 +13,12 @@ console = Console()
 
 @router.post("/{bot_id}/stop", response_class=RedirectResponse)
 async def stop_bot(
-    bot_id: int, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)
+    bot_id: int,
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
+    conn=Depends(get_db_connection)
 ):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Бот #{bot_id} не найден для пользователя #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
         await conn.execute("UPDATE bots SET status = 'stopped' WHERE id = $1", bot_id)
         await send_notification(user["telegram_id"], f"Бот #{bot_id} остановлен.", conn)
         console.log(f"[green]Бот #{bot_id} остановлен")
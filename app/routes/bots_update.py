@@ -2,8 +2,10 @@
 
 from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.responses import RedirectResponse
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
+from ..models.bots import get_owned_bot
+from ..models.prompt import notify_bot_changed
 from ..utils import send_notification, validate_format
 from rich.console import Console
 import json
@@ -17,22 +19,32 @@ async def update_bot(
     prompt: str = Form(...),
     parameters: str = Form(default=""),
     actions: str = Form(default=""),
-    user: dict = Depends(get_current_user_from_token),
+    history_turns: int = Form(default=10),
+    history_token_budget: int = Form(default=3000),
+    summary_token_budget: int = Form(default=500),
+    response_cache: bool = Form(default=False),
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
     conn=Depends(get_db_connection)
 ):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Бот #{bot_id} не найден для пользователя #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
-        
         parameters_json = validate_format(parameters, "parameters")
         actions_json = validate_format(actions, "actions")
+        if min(history_turns, history_token_budget, summary_token_budget) <= 0:
+            raise HTTPException(status_code=400, detail="Параметры истории должны быть положительными")
         
         await conn.execute(
-            "UPDATE bots SET prompt = $1, parameters = $2, actions = $3 WHERE id = $4",
-            prompt, json.dumps(parameters_json), json.dumps(actions_json), bot_id
+            """
+            UPDATE bots
+            SET prompt = $1, parameters = $2, actions = $3,
+                history_turns = $4, history_token_budget = $5, summary_token_budget = $6,
+                response_cache = $7, version = version + 1, updated_at = NOW()
+            WHERE id = $8
+            """,
+            prompt, json.dumps(parameters_json), json.dumps(actions_json),
+            history_turns, history_token_budget, summary_token_budget, response_cache, bot_id
         )
+        await notify_bot_changed(conn, bot_id)
         await send_notification(user["telegram_id"], f"Промпт бота #{bot_id} обновлен.", conn)
         console.log(f"[green]Бот #{bot_id} обновлен")
         return RedirectResponse(url="/bots", status_code=303)
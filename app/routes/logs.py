@@ -1,17 +1,102 @@
+import csv
+import datetime as dt
+import io
+import json
+from urllib.parse import urlencode
 from fastapi import APIRouter, Depends, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from ..templates_config import templates
-from ..auth import get_current_user_from_token
-from ..database import get_db_connection
+from ..auth import get_current_user_claims
+from ..config import SERVICE_CONFIG
+from ..database import get_db_connection, get_pool
+from ..models.bots import get_owned_bot
+from ..models.messages import EXPORT_COLUMNS, fetch_messages_page, iter_messages
+from ..utils import decode_cursor
 
 router = APIRouter()
 
+LOGS_PAGE_SIZE = 50
+LOGS_MAX_PAGE_SIZE = SERVICE_CONFIG.get("logs_max_page_size", 200)
+LOGS_EXPORT_CHUNK_ROWS = SERVICE_CONFIG.get("logs_export_chunk_rows", 500)
+
+def _parse_date(value: str):
+    if not value:
+        return None
+    try:
+        return dt.date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+
+def log_filters(status: str = None, chat_id: str = None, date_from: str = None, date_to: str = None) -> dict:
+    # Пустые поля формы означают «без фильтра»
+    return {
+        "status": status or None,
+        "chat_id": chat_id or None,
+        "date_from": _parse_date(date_from),
+        "date_to": _parse_date(date_to),
+    }
+
 @router.get("/{bot_id}", response_class=HTMLResponse)
 async def logs_page(
-    bot_id: int, request: Request, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)
+    bot_id: int, request: Request, before: str = None, limit: int = LOGS_PAGE_SIZE,
+    filters: dict = Depends(log_filters), user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot), conn=Depends(get_db_connection)
+):
+    limit = max(1, min(limit, LOGS_MAX_PAGE_SIZE))
+    page = await fetch_messages_page(
+        conn, bot_id, before=decode_cursor(before) if before else None, limit=limit, **filters
+    )
+    query = {name: value for name, value in filters.items() if value is not None}
+    if limit != LOGS_PAGE_SIZE:
+        query["limit"] = limit
+    return templates.TemplateResponse(
+        "logs.html",
+        {
+            "request": request, "user": user, "bot": bot, "messages": page["messages"],
+            "next_cursor": page["next_cursor"], "filters": filters, "filters_query": urlencode(query)
+        }
+    )
+
+def _csv_value(value):
+    # Декодированный jsonb пишем в CSV как JSON, а не как repr словаря
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+def _csv_chunk(rows: list, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([_csv_value(row[column]) for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+def _ndjson_chunk(rows: list) -> str:
+    return "".join(json.dumps(dict(row), ensure_ascii=False, default=str) + "\n" for row in rows)
+
+async def _export(bot_id: int, filters: dict, export_format: str):
+    # Соединение берется внутри генератора: зависимость get_db_connection
+    # освобождается раньше, чем отдается тело потокового ответа
+    async with get_pool().acquire() as conn:
+        if export_format == "csv":
+            yield _csv_chunk([], header=True)
+        rows = []
+        async for row in iter_messages(conn, bot_id, prefetch=LOGS_EXPORT_CHUNK_ROWS, **filters):
+            rows.append(row)
+            if len(rows) >= LOGS_EXPORT_CHUNK_ROWS:
+                yield _csv_chunk(rows) if export_format == "csv" else _ndjson_chunk(rows)
+                rows = []
+        if rows:
+            yield _csv_chunk(rows) if export_format == "csv" else _ndjson_chunk(rows)
+
+@router.get("/{bot_id}/export")
+async def export_logs(
+    bot_id: int, format: str = "csv", filters: dict = Depends(log_filters),
+    bot: dict = Depends(get_owned_bot)
 ):
-    bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-    if not bot:
-        raise HTTPException(status_code=404, detail="Бот не найден")
-    messages = await conn.fetch("SELECT * FROM messages WHERE bot_id = $1 ORDER BY timestamp DESC", bot_id)
-    return templates.TemplateResponse("logs.html", {"request": request, "user": user, "bot": bot, "messages": messages})
\ No newline at end of file
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Формат выгрузки: csv или ndjson")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export(bot_id, filters, format),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="bot_{bot_id}_logs.{format}"'}
+    )
@@ -3,20 +3,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
 from ..config import AVITO_AUTH_URL, AVITO_CLIENT_ID, AVITO_REDIRECT_URI
-from ..auth import get_current_user_from_token
-from ..database import get_db_connection
+from ..models.bots import get_owned_bot
 from rich.console import Console
 
 router = APIRouter(prefix="/oauth", tags=["oauth"])
 console = Console()
 
 @router.get("/avito", response_class=RedirectResponse)
-async def avito_auth(bot_id: int, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)):
+async def avito_auth(bot_id: int, bot: dict = Depends(get_owned_bot)):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Bot #{bot_id} not found for user #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
         auth_url = f"{AVITO_AUTH_URL}?client_id={AVITO_CLIENT_ID}&redirect_uri={AVITO_REDIRECT_URI}&response_type=code&state={bot_id}&scope=messenger:read,messenger:write,items:info"
         console.log(f"[green]Redirecting to Avito auth for bot #{bot_id}")
         return RedirectResponse(url=auth_url)
@@ -2,10 +2,12 @@
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from ..config import AVITO_REDIRECT_URI
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
+from ..models.bots import fetch_owned_bot
 from ..models.avito import get_avito_token
+from ..models.avito_catalog import start_sync
+from ..models.avito_tokens import notify_token_changed
 from ..utils import send_notification
 from rich.console import Console
 import datetime as dt
@@ -14,7 +16,7 @@ router = APIRouter(prefix="/oauth", tags=["oauth"])
 console = Console()
 
 @router.get("/avito/callback")
-async def avito_callback(code: str, state: str, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)):
+async def avito_callback(code: str, state: str, user: dict = Depends(get_current_user_claims), conn=Depends(get_db_connection)):
     try:
         # Проверка state
         try:
@@ -24,7 +26,7 @@ async def avito_callback(code: str, state: str, user: dict = Depends(get_current
             raise HTTPException(status_code=400, detail="Неверный параметр state")
 
         # Проверка существования бота
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
+        bot = await fetch_owned_bot(conn, bot_id, user["id"])
         if not bot:
             console.log(f"[red]Bot #{bot_id} not found for user #{user['id']}")
             raise HTTPException(status_code=404, detail="Бот не найден")
@@ -57,6 +59,9 @@ async def avito_callback(code: str, state: str, user: dict = Depends(get_current
             """,
             bot_id, token_data["access_token"], token_data.get("refresh_token"), expires_at, token_data.get("scope", "messenger:read,messenger:write,items:info")
         )
+        await notify_token_changed(conn, bot_id)
+        # Каталог начинает загружаться сразу, пока пользователь переходит к выбору объявлений
+        start_sync(bot_id)
         await conn.execute("UPDATE bots SET is_authorized = TRUE WHERE id = $1", bot_id)
         await send_notification(user["telegram_id"], f"Аккаунт Avito подключен к bоту #{bot_id}.", conn)
         console.log(f"[green]Successfully authorized bot #{bot_id}")
@@ -3,9 +3,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from ..templates_config import templates
-from ..auth import get_current_user_from_token
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
+from ..models.bots import get_owned_bot
 from ..models.avito import fetch_avito_items
+from ..models.avito_catalog import catalog_synced
 from ..utils import send_notification
 from rich.console import Console
 
@@ -16,28 +18,24 @@ console = Console()
 async def select_items_page(
     bot_id: int,
     request: Request,
-    user: dict = Depends(get_current_user_from_token),
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
     conn=Depends(get_db_connection)
 ):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Bot #{bot_id} not found for user #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
-        
         if not bot["is_authorized"]:
             console.log(f"[red]Bot #{bot_id} not authorized")
             raise HTTPException(status_code=400, detail="Аккаунт Avito не привязан")
         
-        token = await conn.fetchrow("SELECT access_token FROM tokens WHERE bot_id = $1", bot_id)
-        if not token:
+        if not bot["has_token"]:
             console.log(f"[red]No token found for bot #{bot_id}")
             raise HTTPException(status_code=400, detail="Аккаунт Avito не привязан")
         
         items = await fetch_avito_items(bot_id, user["id"], conn)
+        syncing = not items and not await catalog_synced(conn, bot_id)
         return templates.TemplateResponse(
             "select_items.html",
-            {"request": request, "user": user, "bot": bot, "items": items, "errors": []}
+            {"request": request, "user": user, "bot": bot, "items": items, "syncing": syncing, "errors": []}
         )
     except HTTPException as e:
         console.log(f"[red]Error in select_items_page: {str(e)}")
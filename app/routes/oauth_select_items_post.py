@@ -1,51 +1,52 @@
 # oauth_select_items_post.py
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from ..templates_config import templates
-from ..auth import get_current_user_from_token
+from fastapi import APIRouter, Depends, Form, HTTPException
+from fastapi.responses import RedirectResponse
+from ..auth import get_current_user_claims
 from ..database import get_db_connection
-from ..models.avito import fetch_avito_items
+from ..models.bots import get_owned_bot
+from ..models.avito_catalog import catalog_synced, get_cached_items
 from ..utils import send_notification
 from rich.console import Console
+import json
 
 router = APIRouter(prefix="/oauth", tags=["oauth"])
 console = Console()
 
-@router.get("/avito/select-items/{bot_id}", response_class=HTMLResponse)
-async def select_items_page(
+@router.post("/avito/select-items/{bot_id}", response_class=RedirectResponse)
+async def save_selected_items(
     bot_id: int,
-    request: Request,
-    user: dict = Depends(get_current_user_from_token),
+    item_ids: list[str] = Form(default=[]),
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
     conn=Depends(get_db_connection)
 ):
     try:
-        bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-        if not bot:
-            console.log(f"[red]Bot #{bot_id} not found for user #{user['id']}")
-            raise HTTPException(status_code=404, detail="Бот не найден")
-        
         if not bot["is_authorized"]:
             console.log(f"[red]Bot #{bot_id} not authorized")
             raise HTTPException(status_code=400, detail="Аккаунт Avito не привязан")
         
-        token = await conn.fetchrow("SELECT access_token FROM tokens WHERE bot_id = $1", bot_id)
-        if not token:
-            console.log(f"[red]No token found for bot #{bot_id}")
-            raise HTTPException(status_code=400, detail="Аккаунт Avito не привязан")
+        items = await get_cached_items(conn, bot_id)
+        if items:
+            known_ids = {str(item["id"]) for item in items}
+            items_data = {"all": False, "items": [item_id for item_id in item_ids if item_id in known_ids]}
+        elif await catalog_synced(conn, bot_id):
+            # В аккаунте нет объявлений — бот будет отвечать по всем новым
+            items_data = {"all": True}
+        else:
+            # Пустой кэш до первой синхронизации — еще не «нет объявлений», выбор не сохраняем
+            raise HTTPException(status_code=409, detail="Список объявлений еще загружается из Avito, попробуйте позже")
         
-        items = await fetch_avito_items(bot_id, user["id"], conn)
-        return templates.TemplateResponse(
-            "select_items.html",
-            {"request": request, "user": user, "bot": bot, "items": items, "errors": []}
+        await conn.execute(
+            "UPDATE bots SET items = $1 WHERE id = $2",
+            json.dumps(items_data), bot_id
         )
+        console.log(f"[green]Selected items saved for bot #{bot_id}")
+        return RedirectResponse(url="/bots", status_code=303)
     except HTTPException as e:
-        console.log(f"[red]Error in select_items_page: {str(e)}")
-        await send_notification(user["telegram_id"], f"Ошибка получения объявлений для бота #{bot_id}: {e.detail}", conn)
-        return templates.TemplateResponse(
-            "select_items.html",
-            {"request": request, "user": user, "bot": bot, "items": [], "errors": [e.detail]}
-        )
+        console.log(f"[red]Error in save_selected_items: {str(e)}")
+        await send_notification(user["telegram_id"], f"Ошибка сохранения объявлений для бота #{bot_id}: {e.detail}", conn)
+        return RedirectResponse(url="/bots", status_code=303)
     except Exception as e:
-        console.log(f"[red]Unexpected error in select_items_page: {str(e)}")
-        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
\ No newline at end of file
+        console.log(f"[red]Unexpected error in save_selected_items: {str(e)}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
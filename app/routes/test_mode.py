@@ -1,94 +1,176 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from ..auth import get_current_user_from_token
-from ..database import get_db_connection
-from ..models.deepseek import query_deepseek
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from rich.console import Console
+from ..auth import get_current_user_claims
+from ..database import get_db_connection, get_pool
+from ..llm_scheduler import LLMOverloaded
+from ..models.bots import get_owned_bot
+from ..models.deepseek import (
+    build_messages, completion_params, iter_reply, query_deepseek, record_usage, run_actions
+)
+from ..models.prompt import get_compiled_bot
+from ..models.history import TEST_CHAT_ID, clear_history, load_history, update_summary
+from ..models.messages import fetch_messages_page
 from ..templates_config import templates
-import datetime as dt
+from ..utils import decode_cursor
 import json
 
 router = APIRouter()
+console = Console()
+
+TEST_PAGE_SIZE = 20
+
+async def _save_turn(conn, bot_id: int, message: str, response: dict):
+    await conn.execute(
+        """
+        INSERT INTO messages (bot_id, text, response, status, is_test, timestamp, chat_id)
+        VALUES ($1, $2, $3, $4, TRUE, NOW(), $5)
+        """,
+        bot_id,
+        message,
+        json.dumps(response, ensure_ascii=False),
+        response.get("status", "Обработано"),
+        TEST_CHAT_ID,
+    )
+
+async def _after_turn(conn, bot, user: dict):
+    await update_summary(conn, bot, TEST_CHAT_ID, True)
+
+    await conn.execute(
+        "INSERT INTO notifications (telegram_id, text, category, status, created_at) VALUES ($1, $2, 'test', 'pending', NOW())",
+        user["telegram_id"],
+        f"Тестовое сообщение для бота #{bot['id']} обработано.",
+    )
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_turn(bot, user: dict, message: str, prompt: str, history: dict):
+    response = None
+    actions_done = False
+    try:
+        messages = build_messages(prompt, message, history["turns"], history["summary"])
+        async for kind, value in iter_reply(
+            priority="test", user_key=user["telegram_id"], **completion_params(messages)
+        ):
+            if kind == "text":
+                yield _sse("delta", {"text": value})
+            elif kind == "field" and value[0] == "actions":
+                # Уведомления уходят сразу, пока модель еще дописывает parameters
+                async with get_pool().acquire() as conn:
+                    await run_actions(conn, user["telegram_id"], value[1])
+                actions_done = True
+            elif kind == "usage":
+                async with get_pool().acquire() as conn:
+                    await record_usage(conn, bot["id"], "reply", True, value)
+            elif kind == "reply":
+                response = value
+    except LLMOverloaded:
+        # Тестовый режим не ждет дольше лимита и не повторяет запрос: живым диалогам нужнее
+        yield _sse("error", {"detail": "Модель перегружена, попробуйте позже"})
+        return
+    except Exception as e:
+        console.log(f"[red]Ошибка потокового ответа DeepSeek для бота #{bot['id']}: {e}")
+
+    # Соединение берется здесь: соединение запроса освобождается до начала потока
+    async with get_pool().acquire() as conn:
+        if response is None:
+            # Поток не дал корректного ответа — обычный запрос с повторами, как в живом режиме
+            yield _sse("reset", {})
+            try:
+                response = await query_deepseek(
+                    prompt=prompt,
+                    message=message,
+                    previous_messages=history["turns"],
+                    conn=conn,
+                    telegram_id=user["telegram_id"],
+                    summary=history["summary"],
+                    actions_done=actions_done,
+                    bot_id=bot["id"],
+                    is_test=True,
+                )
+            except LLMOverloaded:
+                yield _sse("error", {"detail": "Модель перегружена, попробуйте позже"})
+                return
+        await _save_turn(conn, bot["id"], message, response)
+        yield _sse("done", {
+            "message": message,
+            "response": response.get("response", ""),
+            "actions": response.get("actions", []),
+            "parameters": response.get("parameters", []),
+        })
+        await _after_turn(conn, bot, user)
 
 @router.get("/{bot_id}", response_class=HTMLResponse)
 async def test_mode_page(
-    bot_id: int, request: Request, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)
+    bot_id: int, request: Request, before: str = None, user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot), conn=Depends(get_db_connection)
 ):
-    bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-    if not bot:
-        raise HTTPException(status_code=404, detail="Бот не найден")
-    messages = await conn.fetch(
-        "SELECT * FROM messages WHERE bot_id = $1 AND is_test = TRUE ORDER BY timestamp DESC", bot_id
+    page = await fetch_messages_page(
+        conn, bot_id, before=decode_cursor(before) if before else None, limit=TEST_PAGE_SIZE,
+        chat_id=TEST_CHAT_ID, is_test=True
     )
     return templates.TemplateResponse(
-        "test_mode.html", {"request": request, "user": user, "bot": bot, "messages": messages}
+        "test_mode.html",
+        {"request": request, "user": user, "bot": bot, "messages": page["messages"], "next_cursor": page["next_cursor"]}
     )
 
 @router.post("/{bot_id}/send", response_class=RedirectResponse)
 async def send_test_message(
     bot_id: int,
     message: str = Form(...),
-    user: dict = Depends(get_current_user_from_token),
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
     conn=Depends(get_db_connection),
 ):
-    bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-    if not bot:
-        raise HTTPException(status_code=404, detail="Бот не найден")
-
-    previous_messages = await conn.fetch(
-        "SELECT text, response FROM messages WHERE bot_id = $1 AND is_test = TRUE ORDER BY timestamp DESC", bot_id
-    )
+    history = await load_history(conn, bot, TEST_CHAT_ID, is_test=True)
 
-    def enhance_prompt(prompt: str, parameters: str, actions: str):
-        param_list = json.loads(parameters) if parameters else []
-        action_list = json.loads(actions) if actions else []
-        enhanced = (
-            f"{prompt}\n\n"
-            f"Доступные параметры: {', '.join([p['name'] for p in param_list])}\n"
-            f"Доступные действия: {', '.join([a['name'] for a in action_list])}\n"
-            "Отвечай строго в формате JSON с полями: response (строка), actions (массив объектов), parameters (массив объектов), status (строка)."
+    prompt = get_compiled_bot(bot)["prompt"]
+    try:
+        response = await query_deepseek(
+            prompt=prompt,
+            message=message,
+            previous_messages=history["turns"],
+            conn=conn,
+            telegram_id=user["telegram_id"],
+            summary=history["summary"],
+            bot_id=bot_id,
+            is_test=True,
         )
-        return enhanced
-
-    prompt = enhance_prompt(bot["prompt"], bot["parameters"], bot["actions"])
-    response = await query_deepseek(
-        prompt=prompt,
-        message=message,
-        previous_messages=previous_messages,
-        conn=conn,
-        telegram_id=user["telegram_id"],
-    )
-
-    await conn.execute(
-        """
-        INSERT INTO messages (bot_id, text, response, status, is_test, timestamp)
-        VALUES ($1, $2, $3, $4, TRUE, NOW())
-        """,
-        bot_id,
-        message,
-        json.dumps(response, ensure_ascii=False),
-        response.get("status", "Обработано"),
-    )
+    except LLMOverloaded:
+        raise HTTPException(status_code=503, detail="Модель перегружена, попробуйте позже")
 
-    await conn.execute(
-        "INSERT INTO notifications (telegram_id, text, status, created_at) VALUES ($1, $2, 'pending', NOW())",
-        user["telegram_id"],
-        f"Тестовое сообщение для бота #{bot_id} обработано.",
-    )
+    await _save_turn(conn, bot_id, message, response)
+    await _after_turn(conn, bot, user)
 
     return RedirectResponse(url=f"/test/{bot_id}", status_code=303)
 
+@router.post("/{bot_id}/stream")
+async def stream_test_message(
+    bot_id: int,
+    message: str = Form(...),
+    user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot),
+    conn=Depends(get_db_connection),
+):
+    history = await load_history(conn, bot, TEST_CHAT_ID, is_test=True)
+    prompt = get_compiled_bot(bot)["prompt"]
+    return StreamingResponse(
+        _stream_turn(bot, user, message, prompt, history),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/{bot_id}/reset", response_class=RedirectResponse)
 async def reset_test_messages(
-    bot_id: int, user: dict = Depends(get_current_user_from_token), conn=Depends(get_db_connection)
+    bot_id: int, user: dict = Depends(get_current_user_claims),
+    bot: dict = Depends(get_owned_bot), conn=Depends(get_db_connection)
 ):
-    bot = await conn.fetchrow("SELECT * FROM bots WHERE id = $1 AND user_id = $2", bot_id, user["id"])
-    if not bot:
-        raise HTTPException(status_code=404, detail="Бот не найден")
-
     await conn.execute("DELETE FROM messages WHERE bot_id = $1 AND is_test = TRUE", bot_id)
+    await clear_history(conn, bot_id, TEST_CHAT_ID)
 
     await conn.execute(
-        "INSERT INTO notifications (telegram_id, text, status, created_at) VALUES ($1, $2, 'pending', NOW())",
+        "INSERT INTO notifications (telegram_id, text, category, status, created_at) VALUES ($1, $2, 'test', 'pending', NOW())",
         user["telegram_id"],
         f"Тестовый диалог для бота #{bot_id} сброшен.",
     )
@@ -0,0 +1,43 @@
+import asyncio
+from aiogram import Bot
+from .billing import run_billing
+from .config import TELEGRAM_TOKEN, SERVICE_CONFIG
+from .database import init_pool, close_pool, get_pool
+from .events import register_handler, start_listener, stop_listener
+from .notifications import dispatch_notifications
+from .scheduler import Scheduler
+from .models.avito_catalog import CATALOG_MAX_AGE, sync_stale_catalogs
+from .models.avito_client import close_avito_client
+from .models.avito_tokens import TOKEN_REFRESH_INTERVAL, on_avito_token_notify, refresh_expiring_tokens
+
+# Рассылку будит NOTIFY из триггера на notifications; опрос — страховка на случай
+# потерянного NOTIFY и для повторов, отложенных через available_at
+NOTIFICATIONS_INTERVAL = SERVICE_CONFIG.get("notifications_interval", 60)
+
+async def main():
+    await init_pool()
+    telegram = Bot(token=TELEGRAM_TOKEN)
+
+    async def send_notifications(pool):
+        return await dispatch_notifications(pool, telegram)
+
+    scheduler = Scheduler(get_pool())
+    # Списание идемпотентно по дням, поэтому при старте можно догнать пропущенный день
+    scheduler.add_job("billing", run_billing, cron="5 0 * * *", run_at_start=True)
+    scheduler.add_job("avito_token_refresh", refresh_expiring_tokens, every=TOKEN_REFRESH_INTERVAL)
+    scheduler.add_job("catalog_sync", sync_stale_catalogs, every=CATALOG_MAX_AGE)
+    scheduler.add_job("notifications", send_notifications, every=NOTIFICATIONS_INTERVAL)
+
+    register_handler("avito_token", on_avito_token_notify)
+    register_handler("notifications", lambda payload: scheduler.trigger("notifications"))
+    await start_listener()
+    try:
+        await scheduler.run()
+    finally:
+        await stop_listener()
+        await telegram.session.close()
+        await close_avito_client()
+        await close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
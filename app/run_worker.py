@@ -0,0 +1,5 @@
+import asyncio
+from .worker import main
+
+if __name__ == "__main__":
+    asyncio.run(main())
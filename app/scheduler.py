@@ -0,0 +1,187 @@
+import asyncio
+import datetime as dt
+import time
+import asyncpg
+from rich.console import Console
+from .config import DB_CONFIG, SERVICE_CONFIG
+
+console = Console()
+
+SCHEDULER_LEADER_RETRY = SERVICE_CONFIG.get("scheduler_leader_retry", 15)
+SCHEDULER_HEALTH_INTERVAL = SERVICE_CONFIG.get("scheduler_health_interval", 5)
+# Ключ pg_try_advisory_lock лидера: задачи выполняет только один экземпляр планировщика
+SCHEDULER_LOCK_KEY = 1004
+
+class IntervalSchedule:
+    def __init__(self, seconds: float):
+        self.interval = dt.timedelta(seconds=seconds)
+
+    def next_after(self, moment: dt.datetime) -> dt.datetime:
+        return moment + self.interval
+
+class CronSchedule:
+    # Пять полей: минута, час, день месяца, месяц, день недели (0 — воскресенье).
+    # Поддерживаются *, списки через запятую, диапазоны a-b и шаг /n.
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Invalid cron expression: {expression}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/")
+                step = int(step)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            values.update(range(start, end + 1, step))
+        return values
+
+    def next_after(self, moment: dt.datetime) -> dt.datetime:
+        candidate = moment.replace(second=0, microsecond=0) + dt.timedelta(minutes=1)
+        for _ in range(366 * 24 * 60):
+            if (
+                candidate.minute in self.minutes and candidate.hour in self.hours
+                and candidate.day in self.days and candidate.month in self.months
+                and candidate.isoweekday() % 7 in self.weekdays
+            ):
+                return candidate
+            candidate += dt.timedelta(minutes=1)
+        raise ValueError("Cron expression never matches")
+
+class Job:
+    def __init__(self, name: str, func, schedule, run_at_start: bool = False):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.run_at_start = run_at_start
+        self.next_run = None
+        self.triggered = False
+        self.task = None
+
+class Scheduler:
+    def __init__(self, pool):
+        self.pool = pool
+        self.jobs = {}
+        self._wake = asyncio.Event()
+
+    def add_job(self, name: str, func, every: float = None, cron: str = None, run_at_start: bool = False):
+        schedule = CronSchedule(cron) if cron else IntervalSchedule(every)
+        self.jobs[name] = Job(name, func, schedule, run_at_start)
+
+    def trigger(self, name: str):
+        # Внеочередной запуск задачи, расписание при этом не сдвигается
+        self.jobs[name].triggered = True
+        self._wake.set()
+
+    async def _run_job(self, job: Job):
+        started_at = dt.datetime.utcnow()
+        started = time.perf_counter()
+        status, error = "ok", None
+        try:
+            result = await job.func(self.pool)
+            if isinstance(result, (int, float)):
+                # Задача может вернуть число секунд, чтобы ее запустили раньше планового времени
+                run_at = dt.datetime.utcnow() + dt.timedelta(seconds=result)
+                if job.next_run is None or run_at < job.next_run:
+                    job.next_run = run_at
+        except asyncio.CancelledError:
+            status, error = "cancelled", "leadership lost"
+            raise
+        except Exception as e:
+            status, error = "failed", str(e)
+            console.log(f"[red]Job {job.name} failed: {e}")
+        finally:
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            try:
+                async with self.pool.acquire() as conn:
+                    await conn.execute(
+                        """
+                        INSERT INTO scheduler_runs (job_name, started_at, finished_at, duration_ms, status, error)
+                        VALUES ($1, $2, $3, $4, $5, $6)
+                        """,
+                        job.name, started_at, dt.datetime.utcnow(), duration_ms, status, error
+                    )
+            except Exception as e:
+                console.log(f"[red]Failed to record run of job {job.name}: {e}")
+
+    def _running(self, job: Job) -> bool:
+        return job.task is not None and not job.task.done()
+
+    def _start(self, job: Job):
+        if self._running(job):
+            console.log(f"[yellow]Job {job.name} is still running, run skipped")
+            return
+        job.task = asyncio.create_task(self._run_job(job))
+        # Отложенный внеочередной запуск выполняется сразу после завершения текущего
+        job.task.add_done_callback(lambda _: self._wake.set())
+
+    async def _lead(self, conn):
+        now = dt.datetime.utcnow()
+        for job in self.jobs.values():
+            job.next_run = now if job.run_at_start else job.schedule.next_after(now)
+
+        next_health_check = time.monotonic() + SCHEDULER_HEALTH_INTERVAL
+        while True:
+            self._wake.clear()
+            now = dt.datetime.utcnow()
+            for job in self.jobs.values():
+                if job.next_run <= now:
+                    self._start(job)
+                    # Следующий запуск считается от плановой точки, а не от фактического времени,
+                    # поэтому расписание не «уплывает»; пропущенные запуски не догоняются
+                    job.next_run = job.schedule.next_after(job.next_run)
+                    if job.next_run <= now:
+                        job.next_run = job.schedule.next_after(now)
+                elif job.triggered:
+                    if self._running(job):
+                        # Не теряем запуск: повторим, когда текущий закончится
+                        continue
+                    self._start(job)
+                job.triggered = False
+
+            if time.monotonic() >= next_health_check:
+                # Потеря соединения означает потерю advisory lock, а значит и лидерства
+                await conn.execute("SELECT 1")
+                next_health_check = time.monotonic() + SCHEDULER_HEALTH_INTERVAL
+
+            wait = min((job.next_run - dt.datetime.utcnow()).total_seconds() for job in self.jobs.values())
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, min(wait, SCHEDULER_HEALTH_INTERVAL)))
+            except asyncio.TimeoutError:
+                pass
+
+    def _stop_jobs(self):
+        for job in self.jobs.values():
+            if self._running(job):
+                job.task.cancel()
+
+    async def run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**DB_CONFIG)
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", SCHEDULER_LOCK_KEY):
+                    await asyncio.sleep(SCHEDULER_LEADER_RETRY)
+                console.log(f"[green]Scheduler became leader, jobs: {', '.join(self.jobs)}")
+                await self._lead(conn)
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, ConnectionError) as e:
+                console.log(f"[red]Scheduler lost leadership: {e}")
+            finally:
+                self._stop_jobs()
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(SCHEDULER_LEADER_RETRY)
@@ -9,12 +9,22 @@ templates = Jinja2Templates(directory="templates")
 
 # Определение фильтра from_json
 def from_json_filter(value):
+    # Колонки json/jsonb приходят из пула уже декодированными
+    if not isinstance(value, (str, bytes)):
+        return value
     try:
         return json.loads(value)
     except json.JSONDecodeError as e:
         console.log(f"[red]JSON Decode Error in from_json filter: {e}, value: {value}")
         return {}
 
-# Регистрация фильтра
+def to_json_filter(value):
+    # Строки считаем уже сериализованным JSON, как и кодек json/jsonb пула
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+# Регистрация фильтров
 templates.env.filters['from_json'] = from_json_filter
-console.log("[green]Registered from_json filter")
\ No newline at end of file
+templates.env.filters['to_json'] = to_json_filter
+console.log("[green]Registered from_json/to_json filters")
\ No newline at end of file
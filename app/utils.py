@@ -1,5 +1,6 @@
 from fastapi import HTTPException
 from rich.console import Console
+import datetime as dt
 import re
 
 console = Console()
@@ -26,4 +27,14 @@ def validate_format(text: str, field_name: str) -> list:
             raise HTTPException(status_code=400, detail=f"Неверный формат строки в {field_name}: {line}")
         name, description = match.groups()
         result.append({"name": name, "description": description})
-    return result
\ No newline at end of file
+    return result
+
+def encode_cursor(timestamp: dt.datetime, message_id: int) -> str:
+    return f"{timestamp.isoformat()}_{message_id}"
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, message_id = cursor.rsplit("_", 1)
+        return dt.datetime.fromisoformat(timestamp), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
@@ -0,0 +1,25 @@
+import asyncio
+from .database import init_pool, close_pool, get_pool
+from .events import register_handler, start_listener, stop_listener
+from .inbox import run_inbox_workers
+from .outbox import run_outbox_workers
+from .models.avito_client import close_avito_client
+from .models.avito_tokens import on_avito_token_notify
+from .models.deepseek import close_llm_client, set_llm_process_role
+from .models.prompt import on_bot_config_notify
+
+async def main():
+    # Лимит LLM этого процесса — для живых диалогов, отдельно от веб-воркеров с тестовым режимом
+    set_llm_process_role("worker")
+    await init_pool()
+    register_handler("bot_config", on_bot_config_notify)
+    register_handler("avito_token", on_avito_token_notify)
+    await start_listener()
+    try:
+        # Входящие вебхуки и отправка ответов в Avito
+        await asyncio.gather(run_inbox_workers(get_pool()), run_outbox_workers(get_pool()))
+    finally:
+        await stop_listener()
+        await close_avito_client()
+        await close_llm_client()
+        await close_pool()
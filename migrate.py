@@ -0,0 +1,35 @@
+import asyncpg
+import app.config as config
+import asyncio
+import os
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+async def migrate():
+    conn = await asyncpg.connect(**config.DB_CONFIG)
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT NOW())"
+    )
+    applied = {row["name"] for row in await conn.fetch("SELECT name FROM schema_migrations")}
+
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith(".sql") or name in applied:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+            sql = f.read()
+
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        if sql.startswith("-- no-transaction"):
+            for statement in filter(str.strip, sql.split(";")):
+                await conn.execute(statement)
+            await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1)", name)
+        else:
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1)", name)
+        print(f"Применена миграция: {name}")
+
+    await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,22 @@
+-- Привязка аккаунта Avito к боту (user_id из ответа OAuth)
+ALTER TABLE tokens ADD COLUMN IF NOT EXISTS account_id BIGINT;
+CREATE INDEX IF NOT EXISTS tokens_account_id_idx ON tokens (account_id);
+
+-- Входящая очередь вебхуков Avito
+CREATE TABLE IF NOT EXISTS webhook_inbox (
+    id BIGSERIAL PRIMARY KEY,
+    account_id BIGINT NOT NULL,
+    message_id TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    available_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMP,
+    UNIQUE (account_id, message_id)
+);
+
+CREATE INDEX IF NOT EXISTS webhook_inbox_available_idx
+    ON webhook_inbox (available_at)
+    WHERE status IN ('pending', 'processing');
@@ -0,0 +1,18 @@
+-- Идентификатор чата Avito для истории диалога
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS chat_id TEXT;
+UPDATE messages SET chat_id = 'test' WHERE is_test = TRUE AND chat_id IS NULL;
+
+-- Бюджеты истории для каждого бота
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS history_turns INTEGER NOT NULL DEFAULT 10;
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS history_token_budget INTEGER NOT NULL DEFAULT 3000;
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS summary_token_budget INTEGER NOT NULL DEFAULT 500;
+
+-- Скользящее краткое содержание старой части диалога
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    bot_id INTEGER NOT NULL,
+    chat_id TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_until TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (bot_id, chat_id)
+);
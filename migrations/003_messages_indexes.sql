@@ -0,0 +1,8 @@
+-- no-transaction
+-- История и тестовый режим: сообщения одного чата бота по времени
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_bot_chat_test_ts_idx
+    ON messages (bot_id, chat_id, is_test, timestamp, id);
+
+-- Логи бота по всем чатам
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_bot_ts_idx
+    ON messages (bot_id, timestamp, id);
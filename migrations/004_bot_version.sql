@@ -0,0 +1,3 @@
+-- Версия конфигурации бота для кэша скомпилированных промптов
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW();
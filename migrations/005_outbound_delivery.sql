@@ -0,0 +1,16 @@
+-- no-transaction
+-- Доставка ответов бота в чат Avito
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivery_status TEXT;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivery_key UUID;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivery_attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivery_error TEXT;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivery_available_at TIMESTAMP;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMP;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS avito_message_id TEXT;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS messages_delivery_key_idx
+    ON messages (delivery_key);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_delivery_pending_idx
+    ON messages (delivery_available_at)
+    WHERE delivery_status IN ('pending', 'sending');
@@ -0,0 +1,21 @@
+-- Локальный кэш объявлений Avito
+CREATE TABLE IF NOT EXISTS avito_items (
+    bot_id INTEGER NOT NULL,
+    item_id BIGINT NOT NULL,
+    title TEXT,
+    price NUMERIC,
+    status TEXT,
+    url TEXT,
+    data JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (bot_id, item_id)
+);
+
+-- Состояние синхронизации каталога бота
+CREATE TABLE IF NOT EXISTS avito_catalog_sync (
+    bot_id INTEGER PRIMARY KEY,
+    synced_at TIMESTAMP,
+    full_synced_at TIMESTAMP,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
@@ -0,0 +1,12 @@
+-- Журнал ежедневных списаний: одна запись на пользователя за день
+CREATE TABLE IF NOT EXISTS billing_ledger (
+    user_id INTEGER NOT NULL,
+    billing_date DATE NOT NULL,
+    bots_count INTEGER NOT NULL,
+    amount NUMERIC(12, 2) NOT NULL,
+    outcome TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, billing_date)
+);
+
+CREATE INDEX IF NOT EXISTS bots_active_user_idx ON bots (user_id) WHERE status = 'active';
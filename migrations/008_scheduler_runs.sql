@@ -0,0 +1,12 @@
+-- История запусков периодических задач планировщика
+CREATE TABLE IF NOT EXISTS scheduler_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job_name TEXT NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP,
+    duration_ms INTEGER,
+    status TEXT NOT NULL,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS scheduler_runs_job_idx ON scheduler_runs (job_name, started_at);
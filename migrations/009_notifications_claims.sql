@@ -0,0 +1,8 @@
+-- Захват уведомлений пачками и повторы с задержкой
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS available_at TIMESTAMP NOT NULL DEFAULT NOW();
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+CREATE INDEX IF NOT EXISTS notifications_available_idx
+    ON notifications (available_at)
+    WHERE status IN ('pending', 'sending');
@@ -0,0 +1,14 @@
+-- Будим рассылку уведомлений сразу после вставки, а не по опросу.
+-- Триггер на уровне оператора: пачка вставок (например, из биллинга) дает один NOTIFY
+CREATE OR REPLACE FUNCTION notify_notifications_inserted() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('notifications', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notifications_inserted ON notifications;
+CREATE TRIGGER notifications_inserted
+    AFTER INSERT ON notifications
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notifications_inserted();
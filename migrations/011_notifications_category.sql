@@ -0,0 +1,2 @@
+-- Категория уведомления: по ней рассылка решает, склеивать ли уведомления в дайджест
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS category TEXT NOT NULL DEFAULT 'general';
@@ -0,0 +1,15 @@
+-- Сбрасываем кэш пользователей в веб-процессах при любом изменении строки users
+-- (списание баланса, пополнение вручную и т.п.)
+CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('user_changed', NEW.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_changed ON users;
+CREATE TRIGGER users_changed
+    AFTER UPDATE ON users
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION notify_user_changed();
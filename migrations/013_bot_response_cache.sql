@@ -0,0 +1,2 @@
+-- Кэш ответов на повторяющиеся вопросы покупателей включается для каждого бота отдельно
+ALTER TABLE bots ADD COLUMN IF NOT EXISTS response_cache BOOLEAN NOT NULL DEFAULT FALSE;
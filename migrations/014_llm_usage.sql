@@ -0,0 +1,14 @@
+-- Расход токенов LLM по ботам: для оценки кэша контекста DeepSeek и потокенного биллинга
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGSERIAL PRIMARY KEY,
+    bot_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    is_test BOOLEAN NOT NULL DEFAULT FALSE,
+    prompt_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL,
+    latency_ms INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS llm_usage_bot_idx ON llm_usage (bot_id, created_at);
@@ -1,6 +1,5 @@
-from openai import OpenAI
-from config import DS_API_KEY, DS_API_URL
-import json
+from app.models.deepseek import iter_reply
+from app.models.streaming import MalformedReply
 import re
 
 def clean_json_string(raw_string):
@@ -14,8 +13,6 @@ def clean_json_string(raw_string):
     return raw_string.strip()
 
 async def query_model(messages):
-    client = OpenAI(api_key=DS_API_KEY, base_url=DS_API_URL)
-
     # Добавляем инструкцию в конец сообщений, чтобы LLM вернула JSON
     messages_with_instruction = messages.copy() 
 
@@ -24,24 +21,19 @@ async def query_model(messages):
         if not_first_trying:
             messages_with_instruction.append({'role': 'user', 'content': 'Верни ответ в формате JSON!'})
         try:
-            response = client.chat.completions.create(
+            # JSON разбирается по мере генерации: битый ответ обрывается сразу, а не после полной генерации
+            async for kind, value in iter_reply(
+                schema=None,
                 model="deepseek-chat",
                 messages=messages_with_instruction,
-                stream=False,
                 response_format={ 'type': 'json_object' },
                 temperature=1.4
-            )
-            raw_answer = response.choices[0].message.content 
-
-            # Очищаем и парсим JSON
-            cleaned_answer = raw_answer #  clean_json_string(raw_answer)
-            answer_json = json.loads(cleaned_answer)    
-
-            
-            return answer_json
+            ):
+                if kind == "reply":
+                    return value
 
-        except json.JSONDecodeError as e:
-            print(f"Ошибка парсинга JSON: {e}, raw: {raw_answer}")
+        except MalformedReply as e:
+            print(f"Ошибка парсинга JSON: {e}")
             not_first_trying = True
         except Exception as e:
             print(f"Ошибка при получении ответа: {e}")
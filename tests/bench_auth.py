@@ -0,0 +1,100 @@
+import asyncio
+import time
+from passlib.context import CryptContext
+from passlib.handlers.bcrypt import bcrypt
+from app import auth
+
+# Микробенчмарк аутентификации. Запуск: python -m pytest -q -s tests/bench_auth.py
+# База заменена пулом из DB_POOL_SIZE соединений с задержкой ответа DB_LATENCY на каждый запрос
+DB_LATENCY = 0.002
+DB_POOL_SIZE = 10
+REQUESTS = 5000
+CONCURRENCY = 50
+LOGINS = 8
+# Меньше, чем в продакшене (12), чтобы бенчмарк шел секунды; соотношение «до/после» от этого не меняется
+BCRYPT_ROUNDS = 10
+
+USER = {"id": 1, "username": "seller", "telegram_id": "100", "balance": 0, "password_hash": None}
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = 0
+        self.pool = None
+
+    async def fetchrow(self, query, *args):
+        self.queries += 1
+        if self.pool is None:
+            self.pool = asyncio.Semaphore(DB_POOL_SIZE)
+        async with self.pool:
+            await asyncio.sleep(DB_LATENCY)
+        return dict(USER)
+
+    async def prepare(self, query):
+        return self
+
+    async def execute(self, query, *args):
+        pass
+
+async def old_current_user(token: str, conn) -> dict:
+    # Прежний путь: JWT с одним username и запрос users на каждую страницу
+    username = auth.decode_token(token)["username"]
+    return dict(await conn.fetchrow("SELECT * FROM users WHERE username = $1", username))
+
+async def old_login(password: str, conn):
+    user = await conn.fetchrow("SELECT * FROM users WHERE username = $1", "seller")
+    assert bcrypt.verify(password, user["password_hash"])
+
+async def new_login(password: str, conn):
+    assert await auth.authenticate_user("seller", password, conn)
+
+async def pages(current_user, token: str, conn, login=None) -> tuple:
+    # (страниц в секунду, самая долгая страница в мс)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    slowest = 0.0
+
+    async def page():
+        nonlocal slowest
+        async with semaphore:
+            started = time.perf_counter()
+            assert (await current_user(token, conn))["id"] == USER["id"]
+            slowest = max(slowest, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    logins = [login("secret", conn) for _ in range(LOGINS)] if login else []
+    await asyncio.gather(*(page() for _ in range(REQUESTS)), *logins)
+    return REQUESTS / (time.perf_counter() - started), slowest * 1000
+
+def test_auth_throughput(monkeypatch):
+    context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=BCRYPT_ROUNDS)
+    monkeypatch.setattr(auth, "_pwd_context", context)
+    USER["password_hash"] = context.hash("secret")
+    old_token = auth.create_access_token({"username": USER["username"]})
+    new_token = auth.create_access_token(
+        {"username": USER["username"], "user_id": USER["id"], "telegram_id": USER["telegram_id"]}
+    )
+    auth.invalidate_user()
+
+    old_conn, new_conn = FakeConnection(), FakeConnection()
+    before, _ = asyncio.run(pages(old_current_user, old_token, old_conn))
+    after, _ = asyncio.run(pages(auth.get_current_user_from_token, new_token, new_conn))
+    claims, _ = asyncio.run(pages(auth.get_current_user_claims, new_token, FakeConnection()))
+    # Страницы во время входов: bcrypt в цикле событий против пула потоков
+    login_before, stall_before = asyncio.run(pages(old_current_user, old_token, FakeConnection(), old_login))
+    auth.invalidate_user()
+    login_after, stall_after = asyncio.run(pages(auth.get_current_user_from_token, new_token, FakeConnection(), new_login))
+    auth.invalidate_user()
+
+    print(
+        f"\nAuthenticated pages, {REQUESTS} requests, {CONCURRENCY} concurrent, "
+        f"DB pool {DB_POOL_SIZE} x {DB_LATENCY * 1000:.0f} ms:"
+        f"\n  before (query per request): {before:.0f} req/s, {old_conn.queries} queries"
+        f"\n  after (user cache):         {after:.0f} req/s, {new_conn.queries} queries"
+        f"\n  after (JWT claims only):    {claims:.0f} req/s"
+        f"\n  with {LOGINS} concurrent logins, bcrypt {BCRYPT_ROUNDS} rounds: "
+        f"before {login_before:.0f} req/s, slowest page {stall_before:.0f} ms; "
+        f"after {login_after:.0f} req/s, slowest page {stall_after:.0f} ms"
+    )
+    # Промахи только у первых одновременных запросов, пока кэш пуст
+    assert new_conn.queries <= CONCURRENCY
+    assert after > before
+    assert stall_after < stall_before
@@ -0,0 +1,110 @@
+import asyncio
+import datetime as dt
+import os
+import time
+import asyncpg
+import pytest
+from app import billing
+
+# Бенчмарк ежедневного списания на синтетических 100 тыс. пользователей.
+# Нужна пустая тестовая база Postgres: таблицы создаются во временной схеме и удаляются в конце.
+# Запуск: BENCH_DATABASE_URL=postgresql://localhost/bench python -m pytest -q -s tests/bench_billing.py
+DATABASE_URL = os.environ.get("BENCH_DATABASE_URL")
+SCHEMA = "bench_billing"
+USERS = int(os.environ.get("BENCH_BILLING_USERS", 100_000))
+DAILY_COST = 10
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="BENCH_DATABASE_URL не задан")
+
+SCHEMA_SQL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+SET search_path TO {SCHEMA};
+CREATE TABLE users (
+    id SERIAL PRIMARY KEY, telegram_id TEXT, balance NUMERIC(12, 2) NOT NULL, trial_end_date TIMESTAMP
+);
+CREATE TABLE bots (id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL, status TEXT NOT NULL);
+CREATE INDEX bots_user_id_idx ON bots (user_id);
+CREATE INDEX bots_active_user_idx ON bots (user_id) WHERE status = 'active';
+CREATE TABLE notifications (
+    id SERIAL PRIMARY KEY, telegram_id TEXT, text TEXT, category TEXT, status TEXT, created_at TIMESTAMP
+);
+CREATE TABLE billing_ledger (
+    user_id INTEGER NOT NULL, billing_date DATE NOT NULL, bots_count INTEGER NOT NULL,
+    amount NUMERIC(12, 2) NOT NULL, outcome TEXT NOT NULL, created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, billing_date)
+);
+"""
+
+# Пользователи с 0–3 активными ботами; каждый пятый на пробном периоде, каждый седьмой без денег
+SEED_SQL = """
+INSERT INTO users (id, telegram_id, balance, trial_end_date)
+SELECT i, 'tg' || i, CASE WHEN i % 7 = 0 THEN 0 ELSE 1000 END,
+       CASE WHEN i % 5 = 0 THEN NOW() + INTERVAL '3 days' ELSE NOW() - INTERVAL '3 days' END
+FROM generate_series(1, $1) AS i;
+INSERT INTO bots (user_id, status)
+SELECT i, 'active' FROM generate_series(1, $1) AS i, generate_series(1, 3) AS n WHERE n <= i % 4;
+"""
+
+async def old_charge_balance(pool):
+    # Прежний цикл из app/main.py: запрос ботов и UPDATE на каждого пользователя
+    async with pool.acquire() as conn:
+        users = await conn.fetch("SELECT * FROM users")
+        for user in users:
+            bots = await conn.fetch("SELECT * FROM bots WHERE user_id = $1 AND status = 'active'", user["id"])
+            if not bots:
+                continue
+            total_cost = len(bots) * DAILY_COST
+            if user["trial_end_date"] > dt.datetime.utcnow() and len(bots) == 1:
+                continue
+            if user["balance"] < total_cost:
+                for bot in bots:
+                    await conn.execute("UPDATE bots SET status = 'stopped' WHERE id = $1", bot["id"])
+                    await conn.execute(
+                        "INSERT INTO notifications (telegram_id, text, status, created_at) VALUES ($1, $2, 'pending', NOW())",
+                        user["telegram_id"], f"Баланс недостаточен для бота #{bot['id']}. Пополните баланс."
+                    )
+            else:
+                await conn.execute("UPDATE users SET balance = balance - $1 WHERE id = $2", total_cost, user["id"])
+
+async def seed(conn):
+    await conn.execute(SCHEMA_SQL)
+    for statement in SEED_SQL.split(";"):
+        if statement.strip():
+            await conn.execute(statement, USERS)
+    await conn.execute("ANALYZE")
+
+async def timed(pool, job) -> float:
+    async with pool.acquire() as conn:
+        await seed(conn)
+    started = time.perf_counter()
+    await job(pool)
+    return time.perf_counter() - started
+
+async def run() -> tuple:
+    pool = await asyncpg.create_pool(DATABASE_URL, server_settings={"search_path": SCHEMA})
+    try:
+        before = await timed(pool, old_charge_balance)
+        after = await timed(pool, billing.run_billing)
+        async with pool.acquire() as conn:
+            charged = await conn.fetchval("SELECT COUNT(*) FROM billing_ledger WHERE outcome = 'charged'")
+        # Повторный запуск за тот же день ничего не списывает
+        started = time.perf_counter()
+        repeat = await billing.run_billing(pool)
+        rerun = time.perf_counter() - started
+        async with pool.acquire() as conn:
+            await conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        return before, after, rerun, charged, repeat
+    finally:
+        await pool.close()
+
+def test_billing_run_on_synthetic_users(monkeypatch):
+    monkeypatch.setitem(billing.SERVICE_CONFIG, "bot_daily_cost", DAILY_COST)
+    before, after, rerun, charged, repeat = asyncio.run(run())
+    print(
+        f"\nBilling, {USERS} users: per-user loop {before:.1f}s, chunked run {after:.1f}s "
+        f"({before / after:.0f}x), same-day rerun {rerun:.1f}s"
+    )
+    assert charged > 0
+    assert repeat == {"charged": 0, "stopped": 0}
+    assert after < before
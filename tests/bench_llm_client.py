@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from app.models import deepseek
+
+# Бенчмарк клиента LLM против фейкового сервера DeepSeek (httpx.MockTransport с задержкой ответа).
+# Запуск: python -m pytest -q -s tests/bench_llm_client.py
+# «До» — прежний путь: синхронный OpenAI-клиент на каждый вызов внутри async def,
+# «после» — query_deepseek через общий AsyncOpenAI и очередь LLM
+LATENCY = 0.05
+REQUESTS = 200
+CONCURRENCY = 50
+REPLY = {"response": "Да, актуально", "actions": [], "parameters": []}
+
+def completion_body() -> dict:
+    return {
+        "id": "bench", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": json.dumps(REPLY, ensure_ascii=False)}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+def stream_body() -> bytes:
+    content = json.dumps(REPLY, ensure_ascii=False)
+    events = []
+    for i in range(0, len(content), 8):
+        chunk = {
+            "id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "deepseek-chat",
+            "choices": [{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}],
+        }
+        events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+def blocking_handler(request: httpx.Request) -> httpx.Response:
+    time.sleep(LATENCY)
+    return httpx.Response(200, json=completion_body())
+
+async def async_handler(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(LATENCY)
+    if json.loads(request.content).get("stream"):
+        return httpx.Response(200, content=stream_body(), headers={"content-type": "text/event-stream"})
+    return httpx.Response(200, json=completion_body())
+
+async def old_query(message: str) -> dict:
+    client = OpenAI(
+        api_key="bench", base_url="http://deepseek.bench", max_retries=0,
+        http_client=httpx.Client(transport=httpx.MockTransport(blocking_handler))
+    )
+    response = client.chat.completions.create(**deepseek.completion_params([{"role": "user", "content": message}]))
+    return json.loads(response.choices[0].message.content)
+
+async def new_query(message: str) -> dict:
+    return await deepseek.query_deepseek("Промпт бота", message, [], None, "bench")
+
+async def measure(query) -> float:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with semaphore:
+            assert (await query(f"Вопрос {i}"))["response"] == REPLY["response"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - started)
+
+def test_llm_client_throughput(monkeypatch):
+    monkeypatch.setattr(deepseek, "_client", AsyncOpenAI(
+        api_key="bench", base_url="http://deepseek.bench", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(async_handler))
+    ))
+    monkeypatch.setattr(deepseek, "_scheduler", None)
+    monkeypatch.setattr(deepseek, "LLM_MAX_CONCURRENCY", CONCURRENCY)
+
+    before = asyncio.run(measure(old_query))
+    after = asyncio.run(measure(new_query))
+    print(
+        f"\nLLM client, {REQUESTS} requests, {CONCURRENCY} concurrent, server latency {LATENCY * 1000:.0f} ms: "
+        f"before {before:.1f} req/s, after {after:.1f} req/s ({after / before:.1f}x)"
+    )
+    assert after > before * 3
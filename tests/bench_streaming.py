@@ -0,0 +1,68 @@
+import json
+import pathlib
+import time
+from app.models.streaming import REPLY_SCHEMA, ReplyParser
+
+# Инкрементальный разбор ответа против json.loads всего буфера после конца генерации.
+# Запуск: python -m pytest -q -s tests/bench_streaming.py
+# Ответы — образцы в формате ответа бота; модель печатает их с отступами и отдает кусками по ~3 символа
+REPLIES = json.loads((pathlib.Path(__file__).parent / "data" / "sample_replies.json").read_text())
+CHUNK_SIZE = 3
+# Скорость генерации DeepSeek, кусков в секунду: переводит «через сколько кусков» в задержку
+CHUNKS_PER_SECOND = 40
+ROUNDS = 200
+
+def stream(reply: dict) -> list:
+    raw = json.dumps(reply, ensure_ascii=False, indent=2)
+    return [raw[i:i + CHUNK_SIZE] for i in range(0, len(raw), CHUNK_SIZE)]
+
+def incremental(chunks: list) -> tuple:
+    # (ответ, номер куска с первым текстом, номер куска, после которого известны actions)
+    parser = ReplyParser()
+    first_text = actions_at = None
+    for i, chunk in enumerate(chunks, 1):
+        if parser.feed(chunk) and first_text is None:
+            first_text = i
+        for name, _ in parser.pop_fields():
+            if name == "actions":
+                actions_at = i
+    return parser.result(), first_text, actions_at
+
+def whole_buffer(chunks: list) -> tuple:
+    buffer = []
+    for chunk in chunks:
+        buffer.append(chunk)
+    reply = json.loads("".join(buffer))
+    if not isinstance(reply, dict) or any(field not in reply for field in REPLY_SCHEMA):
+        raise ValueError("Неверный ответ")
+    return reply, len(chunks), len(chunks)
+
+def cpu_per_reply(parse, streams: list) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for chunks in streams:
+            parse(chunks)
+    return (time.perf_counter() - started) / (ROUNDS * len(streams))
+
+def test_incremental_parser_against_json_loads():
+    streams = [stream(reply) for reply in REPLIES]
+    for reply, chunks in zip(REPLIES, streams):
+        assert incremental(chunks)[0] == whole_buffer(chunks)[0] == reply
+
+    cpu_incremental = cpu_per_reply(incremental, streams)
+    cpu_whole = cpu_per_reply(whole_buffer, streams)
+    first_text = [incremental(chunks)[1] / CHUNKS_PER_SECOND * 1000 for chunks in streams]
+    actions = [incremental(chunks)[2] / CHUNKS_PER_SECOND * 1000 for chunks in streams]
+    whole = [len(chunks) / CHUNKS_PER_SECOND * 1000 for chunks in streams]
+    print(
+        f"\n{len(REPLIES)} replies, {sum(map(len, streams)) // len(streams)} chunks on average, "
+        f"{CHUNKS_PER_SECOND} chunks/s:"
+        f"\n  CPU per reply: incremental {cpu_incremental * 1e6:.0f} us, json.loads {cpu_whole * 1e6:.0f} us"
+        f"\n  first text:    incremental {sum(first_text) / len(first_text):.0f} ms, "
+        f"json.loads {sum(whole) / len(whole):.0f} ms"
+        f"\n  actions known: incremental {sum(actions) / len(actions):.0f} ms, "
+        f"json.loads {sum(whole) / len(whole):.0f} ms"
+    )
+    # Разбор по кускам дороже по CPU, но остается малой долей времени генерации
+    assert cpu_incremental < 1 / CHUNKS_PER_SECOND
+    assert max(first_text) < min(whole)
@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+import types
+
+# app/config.py с ключами и адресами не хранится в репозитории — для тестов подставляем
+# минимальную конфигурацию, если локального файла нет
+if importlib.util.find_spec("app.config") is None:
+    config = types.ModuleType("app.config")
+    config.SERVICE_CONFIG = {}
+    config.DB_CONFIG = {}
+    config.SECRET_KEY = "test-secret"
+    config.ALGORITHM = "HS256"
+    config.ACCESS_TOKEN_EXPIRE_MINUTES = 60
+    config.COOKIE_NAME = "access_token"
+    config.API_BASE_URL = "http://localhost"
+    config.AVITO_API_URL = "https://api.avito.test"
+    config.AVITO_API_URL_ITEMS = "https://api.avito.test/items"
+    config.AVITO_AUTH_URL = "https://avito.test/oauth"
+    config.AVITO_TOKEN_URL = "https://api.avito.test/token"
+    config.AVITO_CLIENT_ID = "client-id"
+    config.AVITO_CLIENT_SECRET = "client-secret"
+    config.AVITO_REDIRECT_URI = "http://localhost/oauth/callback"
+    config.AVITO_WEBHOOK_URL = "http://localhost/webhook"
+    config.DS_API_KEY = "test-key"
+    config.DS_API_URL = "https://deepseek.test"
+    config.TELEGRAM_TOKEN = "123:test"
+    config.TELEGRAM_BOT_NAME = "test_bot"
+    sys.modules["app.config"] = config
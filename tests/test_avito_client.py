@@ -0,0 +1,31 @@
+import asyncio
+import httpx
+import pytest
+from app.models import avito_client
+
+@pytest.fixture
+def requests(monkeypatch):
+    # Avito всегда отвечает 503: считаем, сколько раз запрос дошел до сервера
+    seen = []
+
+    def handler(request):
+        seen.append(request.method)
+        return httpx.Response(503)
+
+    monkeypatch.setattr(avito_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(avito_client, "AVITO_BACKOFF_BASE", 0)
+    monkeypatch.setattr(avito_client, "_paused_until", 0.0)
+    return seen
+
+def test_get_is_retried(requests):
+    response = asyncio.run(avito_client.avito_request("GET", "https://api.avito.test/items"))
+    assert response.status_code == 503
+    assert len(requests) == avito_client.AVITO_MAX_RETRIES + 1
+
+def test_post_is_not_retried_by_default(requests):
+    asyncio.run(avito_client.avito_request("POST", "https://api.avito.test/token", data={}))
+    assert requests == ["POST"]
+
+def test_post_is_retried_on_opt_in(requests):
+    asyncio.run(avito_client.avito_request("POST", "https://api.avito.test/webhook", json={}, retry=True))
+    assert len(requests) == avito_client.AVITO_MAX_RETRIES + 1
@@ -0,0 +1,152 @@
+import asyncio
+import datetime as dt
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+import httpx
+import pytest
+from fastapi import HTTPException
+from app.config import AVITO_CLIENT_ID, AVITO_CLIENT_SECRET, AVITO_TOKEN_URL
+from app.models import avito_client, avito_tokens
+
+# Фейковый OAuth-сервер Avito: refresh_token одноразовый, каждое обновление выдает новую пару токенов
+class FakeOAuthServer:
+    def __init__(self, refresh_token: str):
+        self.refresh_token = refresh_token
+        self.issued = 0
+        self.requests = []
+        self.fail_with = None
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        assert str(request.url) == AVITO_TOKEN_URL
+        form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        self.requests.append(form)
+        await asyncio.sleep(0.01)
+        if self.fail_with:
+            return httpx.Response(self.fail_with, json={"error": "temporarily_unavailable"})
+        if form.get("client_id") != AVITO_CLIENT_ID or form.get("client_secret") != AVITO_CLIENT_SECRET:
+            return httpx.Response(401, json={"error": "invalid_client"})
+        if form.get("grant_type") != "refresh_token" or form.get("refresh_token") != self.refresh_token:
+            return httpx.Response(400, json={"error": "invalid_grant"})
+        self.issued += 1
+        self.refresh_token = f"refresh-{self.issued}"
+        return httpx.Response(200, json={
+            "access_token": f"access-{self.issued}", "refresh_token": self.refresh_token,
+            "expires_in": 86400, "token_type": "Bearer",
+        })
+
+# Строка tokens одного бота; транзакция берет общий замок, как pg_advisory_xact_lock
+class FakeDatabase:
+    def __init__(self, expires_in: float):
+        self.row = {
+            "access_token": "old-access",
+            "refresh_token": "old-refresh",
+            "expires_at": dt.datetime.utcnow() + dt.timedelta(seconds=expires_in),
+        }
+        self.lock = asyncio.Lock()
+
+    def connect(self):
+        return FakeConnection(self)
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    @asynccontextmanager
+    async def transaction(self):
+        async with self.db.lock:
+            yield
+
+    async def execute(self, query, *args):
+        if query.strip().startswith("UPDATE tokens"):
+            self.db.row = {"access_token": args[0], "refresh_token": args[1], "expires_at": args[2]}
+
+    async def fetchrow(self, query, *args):
+        return dict(self.db.row)
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    avito_tokens._tokens.clear()
+    avito_tokens._locks.clear()
+    yield
+    avito_tokens._tokens.clear()
+    avito_tokens._locks.clear()
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeOAuthServer("old-refresh")
+    monkeypatch.setattr(avito_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(server.handler)))
+    monkeypatch.setattr(avito_client, "_paused_until", 0.0)
+    return server
+
+def get_tokens(db: FakeDatabase, callers: int) -> list:
+    # Каждый вызывающий со своим соединением, как обработчики inbox и outbox
+    async def run():
+        return await asyncio.gather(*(avito_tokens.get_valid_token(1, db.connect()) for _ in range(callers)))
+
+    return asyncio.run(run())
+
+def test_expired_token_is_refreshed_once_for_concurrent_callers(server):
+    db = FakeDatabase(expires_in=-10)
+    tokens = get_tokens(db, callers=20)
+    assert set(tokens) == {"access-1"}
+    assert [form["refresh_token"] for form in server.requests] == ["old-refresh"]
+    assert server.requests[0]["grant_type"] == "refresh_token"
+    # Новые access и refresh токены записаны в базу
+    assert db.row["access_token"] == "access-1"
+    assert db.row["refresh_token"] == "refresh-1" == server.refresh_token
+    assert db.row["expires_at"] > dt.datetime.utcnow() + dt.timedelta(hours=23)
+
+def test_rotated_refresh_token_is_used_next_time(server):
+    db = FakeDatabase(expires_in=-10)
+    assert get_tokens(db, callers=1) == ["access-1"]
+    # Токен снова истек: следующее обновление предъявляет уже новый refresh_token
+    db.row["expires_at"] = dt.datetime.utcnow() - dt.timedelta(seconds=10)
+    avito_tokens.forget_token(1)
+    assert get_tokens(db, callers=5) == ["access-2"] * 5
+    assert [form["refresh_token"] for form in server.requests] == ["old-refresh", "refresh-1"]
+    assert db.row["refresh_token"] == "refresh-2"
+
+def test_token_refreshed_by_another_process_is_reused(server):
+    # Другой процесс уже обновил строку, пока этот ждал замок: повторного обновления нет
+    db = FakeDatabase(expires_in=3600)
+    db.row["access_token"] = "other-access"
+    assert get_tokens(db, callers=10) == ["other-access"] * 10
+    assert server.requests == []
+
+def test_token_inside_margin_is_refreshed(server):
+    db = FakeDatabase(expires_in=avito_tokens.TOKEN_REFRESH_MARGIN - 10)
+    assert get_tokens(db, callers=1) == ["access-1"]
+    assert len(server.requests) == 1
+
+def test_token_outside_margin_is_cached(server):
+    db = FakeDatabase(expires_in=avito_tokens.TOKEN_REFRESH_MARGIN + 60)
+
+    async def run():
+        first = await avito_tokens.get_valid_token(1, db.connect())
+        db.row["access_token"] = "changed-in-db"
+        return first, await avito_tokens.get_valid_token(1, db.connect())
+
+    assert asyncio.run(run()) == ("old-access", "old-access")
+    assert server.requests == []
+
+def test_failed_refresh_falls_back_to_live_token(server):
+    server.fail_with = 503
+    db = FakeDatabase(expires_in=60)
+    assert get_tokens(db, callers=3) == ["old-access"] * 3
+    # Токен в базе не тронут, старый токен не кэшируется: следующий вызов снова попробует обновить
+    assert db.row["refresh_token"] == "old-refresh"
+    assert 1 not in avito_tokens._tokens
+    server.fail_with = None
+    assert get_tokens(db, callers=1) == ["access-1"]
+
+def test_failed_refresh_of_expired_token_raises(server):
+    server.fail_with = 503
+    with pytest.raises(HTTPException):
+        get_tokens(FakeDatabase(expires_in=-10), callers=1)
+    # POST с refresh_token не повторяется: повтор мог бы предъявить уже использованный токен
+    assert len(server.requests) == 1
+
+def test_rejected_refresh_token_raises(server):
+    server.refresh_token = "rotated-elsewhere"
+    with pytest.raises(HTTPException):
+        get_tokens(FakeDatabase(expires_in=-10), callers=1)
@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from app import events
+
+real_sleep = asyncio.sleep
+
+class FakeConnection:
+    def __init__(self):
+        self.channels = []
+        self.termination_listeners = []
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        self.channels.append(channel)
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    def drop(self):
+        # Сервер закрыл соединение: asyncpg вызывает termination-слушателей
+        for callback in self.termination_listeners:
+            callback(self)
+
+    def terminate(self):
+        self.closed = True
+
+    async def close(self):
+        self.closed = True
+
+    async def fetchval(self, query):
+        return 1
+
+class Connections(list):
+    failures = None
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = Connections()
+    failures = {"left": 0}
+
+    async def connect(**kwargs):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise OSError("connection refused")
+        connection = FakeConnection()
+        created.append(connection)
+        return connection
+
+    monkeypatch.setattr(events.asyncpg, "connect", connect)
+    monkeypatch.setattr(events, "_handlers", {})
+    monkeypatch.setattr(events, "LISTEN_HEALTH_INTERVAL", 3600)
+    created.failures = failures
+    return created
+
+def test_reconnects_and_resyncs_after_drop(connections, monkeypatch):
+    payloads = []
+    sleeps = []
+
+    async def fast_sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    async def run():
+        events.register_handler("bot_config", payloads.append)
+        await events.start_listener()
+        monkeypatch.setattr(events.asyncio, "sleep", fast_sleep)
+        events._dispatch(None, 1, "bot_config", "7")
+        connections.failures["left"] = 2
+        connections[0].drop()
+        for _ in range(20):
+            await real_sleep(0)
+        await events.stop_listener()
+
+    asyncio.run(run())
+    assert len(connections) == 2
+    assert connections[1].channels == ["bot_config"]
+    # После переподключения обработчик получает пустой payload — сброс всего кэша
+    assert payloads == ["7", ""]
+    assert [delay for delay in sleeps if delay != events.LISTEN_HEALTH_INTERVAL] == [1, 2]
+    assert connections[1].closed
+
+def test_health_check_failure_triggers_reconnect(connections, monkeypatch):
+    async def broken_fetchval(query):
+        raise ConnectionResetError("network is unreachable")
+
+    async def run():
+        events.register_handler("user_changed", lambda payload: None)
+        monkeypatch.setattr(events, "LISTEN_HEALTH_INTERVAL", 0)
+        await events.start_listener()
+        connections[0].fetchval = broken_fetchval
+        for _ in range(20):
+            await asyncio.sleep(0)
+        await events.stop_listener()
+
+    asyncio.run(run())
+    assert connections[0].closed
+    assert len(connections) >= 2
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+import pytest
+from app import inbox
+from app.models import avito
+
+# Таблица messages по ключу доставки и отметки inbox вместо базы
+class FakeConnection:
+    def __init__(self):
+        self.messages = {}
+        self.done = []
+        self.in_transaction = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+    async def fetchrow(self, query, *args):
+        return {"id": 1, "user_id": 7, "response_cache": False}
+
+    async def fetchval(self, query, delivery_key):
+        return self.messages.get(delivery_key)
+
+    async def execute(self, query, *args):
+        if query.strip().startswith("INSERT INTO messages"):
+            assert self.in_transaction
+            self.messages.setdefault(args[7], args[2])
+        elif query.strip().startswith("UPDATE webhook_inbox SET status = 'done'"):
+            self.done.append((args[0], self.in_transaction))
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    async def query_deepseek(prompt, message, *args, **kwargs):
+        calls.append(message)
+        return {"response": f"Ответ {len(calls)}", "actions": [], "parameters": []}
+
+    async def load_history(conn, bot, chat_id, is_test):
+        return {"summary": "", "turns": []}
+
+    async def update_summary(conn, bot, chat_id, is_test):
+        pass
+
+    monkeypatch.setattr(avito, "query_deepseek", query_deepseek)
+    monkeypatch.setattr(avito, "load_history", load_history)
+    monkeypatch.setattr(avito, "update_summary", update_summary)
+    monkeypatch.setattr(avito, "get_compiled_bot", lambda bot: {"prompt": "", "prompt_hash": "h"})
+    return calls
+
+def process(conn, inbox_id: int):
+    async def finish(conn):
+        await inbox.mark_done(conn, inbox_id)
+
+    return avito.process_avito_message(
+        1, {"text": "Актуально?", "user_id": 5, "chat_id": "c1"}, conn, {"id": 7, "telegram_id": "t"},
+        delivery_key=inbox.inbox_delivery_key(inbox_id), on_saved=finish
+    )
+
+def test_reply_and_done_mark_share_a_transaction(llm_calls):
+    conn = FakeConnection()
+    asyncio.run(process(conn, 10))
+    assert llm_calls == ["Актуально?"]
+    assert list(conn.messages) == [inbox.inbox_delivery_key(10)]
+    assert conn.done == [(10, True)]
+
+def test_retry_of_saved_message_skips_llm_and_second_reply(llm_calls):
+    conn = FakeConnection()
+    asyncio.run(process(conn, 10))
+    # Повтор той же строки inbox: ошибка после записи ответа или истекшая аренда
+    response = asyncio.run(process(conn, 10))
+    assert llm_calls == ["Актуально?"]
+    assert len(conn.messages) == 1
+    assert response == json.loads(conn.messages[inbox.inbox_delivery_key(10)])
+    assert [inbox_id for inbox_id, _ in conn.done] == [10, 10]
+
+def test_delivery_key_is_stable_per_inbox_row():
+    assert inbox.inbox_delivery_key(10) == inbox.inbox_delivery_key(10)
+    assert inbox.inbox_delivery_key(10) != inbox.inbox_delivery_key(11)
+
+class SlowPool:
+    def __init__(self):
+        self.batches = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        await asyncio.sleep(0.01)
+        yield self
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SlowPool()
+
+    async def executemany(conn, name, records):
+        conn.batches.append(records)
+
+    monkeypatch.setattr(inbox, "get_pool", lambda: pool)
+    monkeypatch.setattr(inbox, "executemany", executemany)
+    return pool
+
+def test_timer_flush_is_tracked_and_awaited_on_close(pool):
+    async def run():
+        writer = inbox.InboxWriter(flush_rows=100, flush_interval=0.001)
+        waiters = [asyncio.ensure_future(writer.add(1, {"id": str(i)})) for i in range(3)]
+        await asyncio.sleep(0.005)
+        # Flush по таймеру уже идет: задача хранится в writer, а не только в цикле событий
+        assert len(writer._flush_tasks) == 1
+        await writer.close()
+        assert not writer._flush_tasks
+        await asyncio.gather(*waiters)
+
+    asyncio.run(run())
+    assert [len(batch) for batch in pool.batches] == [3]
+
+def test_failed_timer_flush_is_logged(pool, monkeypatch):
+    errors = []
+    monkeypatch.setattr(inbox, "incr", lambda name, value=1: errors.append(name))
+
+    async def broken_flush():
+        raise RuntimeError("boom")
+
+    async def run():
+        writer = inbox.InboxWriter(flush_rows=100, flush_interval=0.001)
+        monkeypatch.setattr(writer, "flush", broken_flush)
+        writer._start_flush()
+        await asyncio.sleep(0.005)
+        assert not writer._flush_tasks
+
+    asyncio.run(run())
+    assert errors == ["inbox_writer.flush_errors"]
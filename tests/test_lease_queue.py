@@ -0,0 +1,100 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from app.lease_queue import LeaseQueue
+
+# Очередь в памяти вместо таблицы с арендой: claim отдает строки по порядку
+class FakePool:
+    def __init__(self, rows: int):
+        self.pending = list(range(rows))
+
+    @asynccontextmanager
+    async def acquire(self):
+        await asyncio.sleep(0)
+        yield self
+
+def test_processes_every_row_once_under_load():
+    pool = FakePool(rows=2000)
+    handled, failed, done = [], [], []
+    in_flight = {"now": 0, "max": 0}
+    finished = asyncio.Event()
+
+    async def claim(conn, limit):
+        assert limit <= 16
+        rows, conn.pending = conn.pending[:limit], conn.pending[limit:]
+        return [{"id": row_id} for row_id in rows]
+
+    async def handle(conn, row):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            await asyncio.sleep(random.uniform(0, 0.002))
+            if row["id"] % 100 == 0:
+                raise RuntimeError("Avito API 503")
+            handled.append(row["id"])
+        finally:
+            in_flight["now"] -= 1
+
+    async def mark_done(conn, row):
+        done.append(row["id"])
+        check()
+
+    async def mark_failed(conn, row, error):
+        failed.append((row["id"], error))
+        check()
+
+    def check():
+        if len(done) + len(failed) == 2000:
+            finished.set()
+
+    async def run():
+        queue = LeaseQueue(
+            "Test", claim=claim, handle=handle, mark_done=mark_done, mark_failed=mark_failed,
+            concurrency=8, batch_size=16, poll_interval=0.01
+        )
+        task = asyncio.create_task(queue.run(pool))
+        await asyncio.wait_for(finished.wait(), 30)
+        task.cancel()
+
+    asyncio.run(run())
+    assert sorted(done) == sorted(handled) == [i for i in range(2000) if i % 100]
+    assert [row_id for row_id, _ in failed] == list(range(0, 2000, 100))
+    assert all(error == "Avito API 503" for _, error in failed)
+    assert in_flight["max"] <= 8
+
+def test_lease_is_renewed_while_row_is_handled():
+    pool = FakePool(rows=1)
+    renewed, done = [], asyncio.Event()
+
+    async def claim(conn, limit):
+        rows, conn.pending = conn.pending[:limit], conn.pending[limit:]
+        return [{"id": row_id} for row_id in rows]
+
+    async def handle(conn, row):
+        await asyncio.sleep(0.055)
+
+    async def mark_done(conn, row):
+        done.set()
+
+    async def mark_failed(conn, row, error):
+        raise AssertionError(error)
+
+    async def renew(conn, row):
+        renewed.append(row["id"])
+
+    async def run():
+        queue = LeaseQueue(
+            "Test", claim=claim, handle=handle, mark_done=mark_done, mark_failed=mark_failed,
+            renew=renew, renew_interval=0.01, concurrency=2, poll_interval=0.01
+        )
+        task = asyncio.create_task(queue.run(pool))
+        await asyncio.wait_for(done.wait(), 5)
+        count = len(renewed)
+        # После обработки продление останавливается
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return count
+
+    count = asyncio.run(run())
+    assert 3 <= count == len(renewed)
+    assert set(renewed) == {0}
@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from app.llm_scheduler import LLMOverloaded, LLMScheduler
+
+WEIGHTS = {"live": 6, "test": 3, "background": 1}
+
+def scheduler(max_in_flight: int = 1, max_queued: int = 100, max_wait: float = 5.0) -> LLMScheduler:
+    return LLMScheduler(
+        max_in_flight, WEIGHTS,
+        {priority: max_queued for priority in WEIGHTS}, {priority: max_wait for priority in WEIGHTS}
+    )
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_cancel_while_queued_does_not_leak_slot():
+    async def run():
+        s = scheduler()
+        await s.acquire("live")
+        waiter = asyncio.create_task(s.acquire("test", "a"))
+        await settle()
+        waiter.cancel()
+        # release() до того, как отмененное ожидание успело убрать себя из очереди
+        s.release()
+        assert s.in_flight == 0
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert s.in_flight == 0
+        assert s.queued() == {"live": 0, "test": 0, "background": 0}
+        await asyncio.wait_for(s.acquire("live"), 1)
+        assert s.in_flight == 1
+
+    asyncio.run(run())
+
+def test_cancel_after_slot_granted_returns_it():
+    async def run():
+        s = scheduler()
+        await s.acquire("live")
+        waiter = asyncio.create_task(s.acquire("test", "a"))
+        await settle()
+        s.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert s.in_flight == 0
+
+    asyncio.run(run())
+
+def test_timeout_while_queued_sheds():
+    async def run():
+        s = scheduler(max_wait=0.01)
+        await s.acquire("live")
+        with pytest.raises(LLMOverloaded):
+            await s.acquire("background", "a")
+        assert s.queued()["background"] == 0
+        s.release()
+        assert s.in_flight == 0
+        await asyncio.wait_for(s.acquire("background"), 1)
+
+    asyncio.run(run())
+
+def test_full_queue_sheds_immediately():
+    async def run():
+        s = scheduler(max_queued=1)
+        await s.acquire("live")
+        first = asyncio.create_task(s.acquire("test", "a"))
+        await settle()
+        with pytest.raises(LLMOverloaded):
+            await s.acquire("test", "b")
+        s.release()
+        await first
+        assert s.in_flight == 1
+
+    asyncio.run(run())
+
+def test_priority_weights_and_user_fairness():
+    async def run():
+        s = scheduler()
+        await s.acquire("live")
+        order = []
+
+        async def job(priority, user):
+            async with s.slot(priority, user):
+                order.append((priority, user))
+
+        tasks = [asyncio.create_task(job("background", "bg")) for _ in range(2)]
+        tasks += [asyncio.create_task(job("test", "a")) for _ in range(4)]
+        tasks += [asyncio.create_task(job("test", "b")) for _ in range(2)]
+        tasks += [asyncio.create_task(job("live", "c")) for _ in range(6)]
+        await settle()
+        s.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    assert len(order) == 14
+    # Пока ждут живые диалоги, на каждые 10 выдач приходится 6 live, 3 test и 1 background
+    first = order[:10]
+    assert [priority for priority, _ in first].count("live") == 6
+    assert [priority for priority, _ in first].count("test") == 3
+    assert [priority for priority, _ in first].count("background") == 1
+    # Внутри приоритета пользователи чередуются: b не ждет, пока a выберет все свои запросы
+    tests = [user for priority, user in order if priority == "test"]
+    assert tests[:4] == ["a", "b", "a", "b"]
+
+def test_no_queue_jumping_when_waiters_exist():
+    async def run():
+        s = scheduler()
+        await s.acquire("live")
+        waiter = asyncio.create_task(s.acquire("background", "a"))
+        await settle()
+        s.release()
+        # Слот уже передан ожидающему — новый запрос встает в очередь
+        assert s.in_flight == 1
+        late = asyncio.create_task(s.acquire("live", "b"))
+        await settle()
+        await waiter
+        assert not late.done()
+        s.release()
+        await late
+
+    asyncio.run(run())
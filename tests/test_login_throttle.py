@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from fastapi import HTTPException, Response
+from app import auth
+
+@pytest.fixture(autouse=True)
+def limiters(monkeypatch):
+    monkeypatch.setattr(auth, "_login_failures", auth.AttemptLimiter(3, 300))
+    monkeypatch.setattr(auth, "_ip_failures", auth.AttemptLimiter(5, 300))
+
+    async def authenticate_user(username, password, conn):
+        return {"username": username, "id": 1, "telegram_id": "42"} if password == "right" else None
+
+    monkeypatch.setattr(auth, "authenticate_user", authenticate_user)
+
+def login(username: str, password: str, ip: str) -> int:
+    try:
+        asyncio.run(auth.login_for_access_token(Response(), username, password, None, client_ip=ip))
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+def test_attacker_ip_does_not_lock_out_owner():
+    assert [login("alice", "wrong", "6.6.6.6") for _ in range(4)] == [401, 401, 401, 429]
+    assert login("alice", "right", "1.1.1.1") == 200
+
+def test_ip_limit_covers_many_usernames():
+    statuses = [login(f"user{i}", "wrong", "6.6.6.6") for i in range(6)]
+    assert statuses == [401] * 5 + [429]
+    assert login("alice", "right", "1.1.1.1") == 200
+
+def test_success_resets_pair_counter():
+    assert [login("alice", "wrong", "1.1.1.1") for _ in range(2)] == [401, 401]
+    assert login("alice", "right", "1.1.1.1") == 200
+    assert [login("alice", "wrong", "1.1.1.1") for _ in range(3)] == [401, 401, 401]
@@ -0,0 +1,86 @@
+import pytest
+from app.models import response_cache
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    response_cache._cache.clear()
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: clock["now"])
+    yield clock
+    response_cache._cache.clear()
+
+@pytest.fixture
+def fuzzy(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_TRIGRAM_SIMILARITY", 0.9)
+
+def reply(text: str) -> dict:
+    return {"response": text, "actions": [], "parameters": []}
+
+def test_exact_tier_matches_normalized_text():
+    response_cache.store(1, "h", "Товар ещё актуален?", reply("да"))
+    assert response_cache.lookup(1, "h", "  товар еще АКТУАЛЕН!!") == reply("да")
+
+def test_fuzzy_tier_is_off_by_default():
+    response_cache.store(1, "h", "Здравствуйте, товар еще актуален?", reply("да"))
+    assert response_cache.lookup(1, "h", "Здравствуйте! Товар актуален?") is None
+
+def test_fuzzy_tier_matches_near_spelling(fuzzy):
+    response_cache.store(1, "h", "Здравствуйте, товар еще актуален?", reply("да"))
+    assert response_cache.lookup(1, "h", "Здравствуйте! Товар актуален?") == reply("да")
+
+def test_fuzzy_tier_is_not_semantic(fuzzy):
+    # Триграммы сравнивают написание: тот же вопрос другими словами не совпадает
+    response_cache.store(1, "h", "Товар еще актуален?", reply("да"))
+    assert response_cache.lookup(1, "h", "Можно еще купить?") is None
+
+@pytest.mark.parametrize("stored, asked", [
+    ("Отдадите за 4000 рублей? Могу забрать сегодня вечером", "Отдадите за 3000 рублей? Могу забрать сегодня вечером"),
+    ("Здравствуйте, а размер 42 у вас есть в наличии?", "Здравствуйте, а размер 44 у вас есть в наличии?"),
+    ("товар еще актуален?", "товар уже не актуален?"),
+    ("доставка есть?", "доставки нет?"),
+])
+def test_fuzzy_tier_never_mixes_numbers_or_negations(fuzzy, stored, asked):
+    response_cache.store(1, "h", stored, reply("да"))
+    assert response_cache.lookup(1, "h", asked) is None
+
+def test_prompt_change_drops_bot_entries():
+    response_cache.store(1, "old", "актуально?", reply("да"))
+    assert response_cache.lookup(1, "new", "актуально?") is None
+    assert response_cache.lookup(1, "old", "актуально?") is None
+
+def test_entries_expire(clean_cache, fuzzy):
+    response_cache.store(1, "h", "актуально?", reply("да"))
+    clean_cache["now"] += response_cache.RESPONSE_CACHE_TTL - 1
+    assert response_cache.lookup(1, "h", "актуально?") == reply("да")
+    clean_cache["now"] += 2
+    assert response_cache.lookup(1, "h", "актуально?") is None
+    assert response_cache.lookup(1, "h", "актуально") is None
+
+def test_lru_eviction_of_entries(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_SIZE", 2)
+    response_cache.store(1, "h", "первый", reply("1"))
+    response_cache.store(1, "h", "второй", reply("2"))
+    assert response_cache.lookup(1, "h", "первый") == reply("1")
+    response_cache.store(1, "h", "третий", reply("3"))
+    assert response_cache.lookup(1, "h", "второй") is None
+    assert response_cache.lookup(1, "h", "первый") == reply("1")
+    assert response_cache.lookup(1, "h", "третий") == reply("3")
+
+def test_lru_eviction_of_bots(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_BOTS", 2)
+    for bot_id in (1, 2):
+        response_cache.store(bot_id, "h", "актуально?", reply(str(bot_id)))
+    assert response_cache.lookup(1, "h", "актуально?") == reply("1")
+    # Смена промпта бота 2 не должна вытеснять его самого
+    response_cache.store(2, "h2", "актуально?", reply("2"))
+    response_cache.store(3, "h", "актуально?", reply("3"))
+    assert set(response_cache._cache) == {2, 3}
+
+def test_invalidation():
+    response_cache.store(1, "h", "актуально?", reply("1"))
+    response_cache.store(2, "h", "актуально?", reply("2"))
+    response_cache.invalidate_responses(1)
+    assert response_cache.lookup(1, "h", "актуально?") is None
+    assert response_cache.lookup(2, "h", "актуально?") == reply("2")
+    response_cache.invalidate_responses()
+    assert response_cache._cache == {}
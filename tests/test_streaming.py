@@ -0,0 +1,107 @@
+import json
+import pytest
+from app.models.streaming import MalformedReply, ReplyParser
+
+REPLY = {
+    "response": 'Да, "актуально" \\ цена 3000 ₽\nзабрать можно сегодня 😀',
+    "actions": [{"action": "уведомить", "value": "клиент готов \"платить\""}],
+    "parameters": [{"parameter": "цена", "value": "3000"}, {"parameter": "скидка", "value": None}],
+    "confidence": [0.5, -1e-3, 12, True, False, {}],
+}
+
+def parse(chunks) -> tuple:
+    parser = ReplyParser()
+    text, fields = [], []
+    for chunk in chunks:
+        text.append(parser.feed(chunk))
+        fields.extend(parser.pop_fields())
+    return parser.result(), "".join(text), fields
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_split_at_every_offset(ensure_ascii):
+    raw = json.dumps(REPLY, ensure_ascii=ensure_ascii, indent=1)
+    for offset in range(len(raw) + 1):
+        result, text, fields = parse([raw[:offset], raw[offset:]])
+        assert result == REPLY, offset
+        assert text == REPLY["response"], offset
+        assert [name for name, _ in fields] == list(REPLY), offset
+
+def test_one_character_at_a_time():
+    raw = json.dumps(REPLY)
+    result, text, _ = parse(raw)
+    assert result == REPLY
+    assert text == REPLY["response"]
+
+def test_actions_are_available_before_reply_ends():
+    raw = json.dumps(REPLY)
+    parser = ReplyParser()
+    cut = raw.index('"parameters"')
+    parser.feed(raw[:cut])
+    assert dict(parser.pop_fields())["actions"] == REPLY["actions"]
+    assert not parser.done
+
+def test_escapes_inside_strings():
+    raw = r'{"response": "a\"b\\c\/dф😀\t", "actions": [], "parameters": []}'
+    result, text, _ = parse([raw])
+    assert result["response"] == 'a"b\\c/dф😀\t'
+    assert text == result["response"]
+
+def test_unicode_escape_split_across_chunks():
+    raw = '{"response": "\\u0444\\ud83d\\ude00", "actions": [], "parameters": []}'
+    for offset in range(len(raw) + 1):
+        assert parse([raw[:offset], raw[offset:]])[1] == "ф😀"
+
+def test_nested_key_named_response_is_not_streamed():
+    raw = '{"actions": [{"response": "нет"}], "response": "да", "parameters": []}'
+    assert parse([raw])[1] == "да"
+
+@pytest.mark.parametrize("raw", [
+    '["response"]',
+    '{"response": 5, "actions": [], "parameters": []}',
+    '{"response": "a", "actions": {}, "parameters": []}',
+    '{"response": "a", "actions": ["уведомить"], "parameters": []}',
+    '{"response": "a", "actions": [], "parameters": []} {}',
+    '{"response" "a"}',
+    '{"response": "a",, "actions": []}',
+    '{"response": "a"]',
+    '{"response": "\\x"}',
+    '{"response": "\\u12g4"}',
+    '{"response": tru}',
+    '{"price": 1.2.3}',
+    'Вот ваш JSON: {"response": "a"}',
+])
+def test_malformed_reply_fails_while_streaming(raw):
+    parser = ReplyParser()
+    with pytest.raises(MalformedReply):
+        parser.feed(raw)
+        parser.result()
+
+def test_malformed_reply_fails_before_end():
+    # Ошибка видна на первом же неверном символе — поток можно обрывать, не дожидаясь конца
+    parser = ReplyParser()
+    parser.feed('{"response": "ok", "actions": ')
+    with pytest.raises(MalformedReply):
+        parser.feed('"уведомить", "parameters": [] + много текста')
+
+@pytest.mark.parametrize("raw", [
+    "",
+    '{"response": "обрыв',
+    '{"response": "a", "actions": [{"action": "уведомить"}',
+    '{"response": "a", "actions": []',
+])
+def test_truncated_reply(raw):
+    parser = ReplyParser()
+    parser.feed(raw)
+    with pytest.raises(MalformedReply):
+        parser.result()
+
+def test_missing_required_field():
+    parser = ReplyParser()
+    parser.feed('{"response": "a", "actions": []}')
+    with pytest.raises(MalformedReply, match="parameters"):
+        parser.result()
+
+def test_schema_is_optional():
+    parser = ReplyParser(schema=None)
+    parser.feed('{"response_to_user": 1, "items": [2, "три"]}')
+    assert parser.result() == {"response_to_user": 1, "items": [2, "три"]}